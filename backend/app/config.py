@@ -23,9 +23,42 @@ class Settings(BaseSettings):
     # Processing Configuration
     max_upload_size_mb: int = 100
     max_concurrent_processing: int = 4
+    # Add LLM-extracted relationships during PDF ingestion (several sentences per request)
     enable_llm_extraction: bool = False
+    # How LLM extraction submits sentences: "bulk" (several per prompt), "per_sentence"
+    # (one concurrent request each) or "batch" (one prompt each through the Message
+    # Batches API: half price, results take minutes)
+    llm_extraction_mode: str = "bulk"
+    # Upper bound on in-flight LLM requests shared across all chat sessions
+    llm_max_concurrency: int = 8
+    # Requests-per-minute cap for batched LLM fan-out (0 = unlimited; needs aiolimiter)
+    llm_requests_per_minute: int = 0
+    # Prompt -> response cache for extraction/classification/insight calls (0 disables)
+    llm_cache_size: int = 4096
+    # Persist the exact-match response cache here via diskcache (in-memory when empty)
+    llm_cache_dir: str = ""
+    # Also reuse extraction/classification responses for near-duplicate sentences
+    # about the same entities (needs sentence-transformers)
+    llm_semantic_cache: bool = False
+    # Cache PubMed search results and parsed articles here via diskcache (disabled when empty)
+    pubmed_cache_dir: str = ""
+    pubmed_cache_ttl_seconds: int = 7 * 24 * 3600
+    # Embed RAG chunks for semantic retrieval (needs sentence-transformers; faiss-cpu for ANN search)
+    rag_semantic_search: bool = False
+    rag_embedding_model: str = "all-MiniLM-L6-v2"
+    # Shortlist semantic matches by Hamming distance on binarized embeddings, then rescore
+    rag_binary_quantization: bool = False
     # Use a fine-grained biomedical NER by default
     scispacy_model: str = "en_ner_bionlp13cg_md"
+    # Sentences per nlp.pipe batch, and worker processes for NER (-1 = all CPUs)
+    ner_batch_size: int = 128
+    ner_n_process: int = 1
+    # Run NER on a CUDA GPU when one is available (needs cupy); falls back to CPU otherwise
+    ner_use_gpu: bool = False
+    # Use rustworkx for graph analytics when installed (networkx otherwise)
+    enable_rustworkx: bool = True
+    # Use igraph's multilevel (Louvain) community detection when installed
+    enable_igraph: bool = True
     
     # CORS
     cors_origins: List[str] = ["http://localhost:5173", "http://localhost:3000"]
@@ -1,12 +1,13 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from typing import List, Optional
 import uuid
 import os
 import shutil
 from pathlib import Path
 import asyncio
+import json
 from datetime import datetime
 import networkx as nx
 
@@ -80,7 +81,8 @@ from app.models import (
 )
 from app.services.auth_service import get_current_user, get_current_user_optional
 from app.services.llm_service import LLMService
-from app.services.rag_service import RAGService
+from app.services.rag_service import RAGService, read_index_metadata, write_index_metadata
+from app.services.pdf_processor import shutdown_process_pool
 from app.services.document_chunker import DocumentChunker
 from app.services.ner_service import NERService
 from app.services.relationship_extractor import RelationshipExtractor
@@ -137,9 +139,9 @@ app.add_middleware(
 pdf_processor = PDFProcessor()
 from app.config import settings as _settings
 ner_service = NERService(model_name=_settings.scispacy_model)
-relationship_extractor = RelationshipExtractor()
 graph_builder = GraphBuilder()
 llm_service = LLMService()
+relationship_extractor = RelationshipExtractor(llm_service=llm_service)
 rag_service = RAGService(llm_service=llm_service)
 document_chunker = DocumentChunker(chunk_size=500, overlap=100)
 pubmed_service = PubMedService()
@@ -161,6 +163,14 @@ async def startup_event():
     print(f"✅ Empirica API running on http://{settings.api_host}:{settings.api_port}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release shared client connections and worker processes on shutdown"""
+    await llm_service.aclose()
+    await pubmed_service.aclose()
+    shutdown_process_pool()
+
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -268,6 +278,12 @@ async def process_pdfs_background(
         pdf_graphs = []
         total_pdfs = len(pdf_files)
         
+        # Parse all PDFs up front (in parallel worker processes)
+        processing_jobs[job_id].message = f"Extracting text from {total_pdfs} PDFs..."
+        pdf_results = await asyncio.to_thread(
+            pdf_processor.process_pdfs, [pdf_file["path"] for pdf_file in pdf_files]
+        )
+        
         # Process each PDF individually
         for idx, pdf_file in enumerate(pdf_files):
             pdf_path = pdf_file["path"]
@@ -292,8 +308,8 @@ async def process_pdfs_background(
             db.commit()
             
             try:
-                # Extract text from this PDF
-                pdf_result = pdf_processor.process_pdfs([pdf_path])[0]
+                # Text extracted from this PDF
+                pdf_result = pdf_results[idx]
                 
                 # Check for errors or missing data
                 if "error" in pdf_result or not pdf_result.get("sentences"):
@@ -337,7 +353,7 @@ async def process_pdfs_background(
                 print(f"  → Indexed {len(chunks)} chunks for RAG")
                 
                 # Extract relationships for this PDF
-                relationships = relationship_extractor.extract_all_relationships(filtered_entities)
+                relationships = await relationship_extractor.extract_all_relationships_with_llm(filtered_entities)
                 
                 # Build graph for this PDF
                 pdf_graph = graph_builder.build_graph(unique_entities, relationships)
@@ -403,7 +419,7 @@ async def process_pdfs_background(
             rag_service.set_graph_context(graph_builder.graph, entity_metadata)
             
             # Save RAG index for this project
-            rag_index_path = f"uploads/{project.id}_rag_index.pkl"
+            rag_index_path = f"uploads/{project.id}_rag_index.json"
             rag_service.save_index(rag_index_path)
             print(f"✓ Saved RAG index to {rag_index_path}")
         
@@ -708,6 +724,11 @@ async def add_pdfs_to_project_background(
         
         total_pdfs = len(pdf_files)
         
+        # Parse all PDFs up front (in parallel worker processes)
+        pdf_results = await asyncio.to_thread(
+            pdf_processor.process_pdfs, [pdf_file["path"] for pdf_file in pdf_files]
+        )
+        
         # Process each PDF individually
         for idx, pdf_file in enumerate(pdf_files):
             pdf_path = pdf_file["path"]
@@ -731,8 +752,8 @@ async def add_pdfs_to_project_background(
             db.commit()
             
             try:
-                # Extract text from this PDF
-                pdf_result = pdf_processor.process_pdfs([pdf_path])[0]
+                # Text extracted from this PDF
+                pdf_result = pdf_results[idx]
                 
                 # Check for errors or missing data
                 if "error" in pdf_result or not pdf_result.get("sentences"):
@@ -750,7 +771,7 @@ async def add_pdfs_to_project_background(
                 unique_entities = ner_service.get_unique_entities(filtered_entities)
                 
                 # RAG: Load existing index, chunk and index new document
-                rag_index_path = f"uploads/{project_id}_rag_index.pkl"
+                rag_index_path = f"uploads/{project_id}_rag_index.json"
                 rag_service.load_index(rag_index_path)
                 
                 entity_list = [{"text": ent["text"], "start": 0, "end": 0, "type": ent["label"]} 
@@ -770,7 +791,7 @@ async def add_pdfs_to_project_background(
                 print(f"  → Indexed {len(chunks)} chunks for RAG")
                 
                 # Extract relationships for this PDF
-                relationships = relationship_extractor.extract_all_relationships(filtered_entities)
+                relationships = await relationship_extractor.extract_all_relationships_with_llm(filtered_entities)
                 
                 # Build graph for this PDF
                 pdf_graph = graph_builder.build_graph(unique_entities, relationships)
@@ -811,7 +832,7 @@ async def add_pdfs_to_project_background(
                 db.commit()
         
         # RAG: Save updated index
-        rag_index_path = f"uploads/{project_id}_rag_index.pkl"
+        rag_index_path = f"uploads/{project_id}_rag_index.json"
         rag_service.save_index(rag_index_path)
         print(f"✓ Updated RAG index at {rag_index_path}")
         
@@ -943,6 +964,45 @@ async def get_project_graph(
 
 # ==== Conversational Agent Endpoints ====
 
+def _rebuild_chat_graph(graph: dict) -> None:
+    """Rebuild graph_builder's graph from the nodes/edges a chat client sends"""
+    nodes = graph.get("nodes", [])
+    edges = graph.get("edges", [])
+
+    # Rebuild graph
+    entities = {
+        n.get("id"): {
+            "original_name": n.get("id"),
+            "type": (n.get("group") or "UNKNOWN"),
+            "count": (n.get("metadata") or {}).get("count", 1),
+        }
+        for n in nodes
+        if n.get("id")
+    }
+
+    relationships = []
+    for e in edges:
+        # Handle both string IDs and object references
+        source_id = e.get("source")
+        target_id = e.get("target")
+
+        # If source/target are objects, extract the 'id' field
+        if isinstance(source_id, dict):
+            source_id = source_id.get("id")
+        if isinstance(target_id, dict):
+            target_id = target_id.get("id")
+
+        relationships.append({
+            "source": source_id,
+            "target": target_id,
+            "weight": e.get("value", 1.0),
+            "evidence": (e.get("metadata") or {}).get("all_evidence", [e.get("title", "")]),
+            "relationship_type": (e.get("metadata") or {}).get("relationship_type", "CO_OCCURRENCE"),
+        })
+
+    graph_builder.build_graph(entities, relationships)
+
+
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat_with_graph(
     payload: dict,
@@ -953,41 +1013,8 @@ async def chat_with_graph(
         message = (payload or {}).get("message", "")
         graph = (payload or {}).get("graph", {})
         conversation_history = (payload or {}).get("conversation_history", [])
-        nodes = graph.get("nodes", [])
-        edges = graph.get("edges", [])
         
-        # Rebuild graph
-        entities = {
-            n.get("id"): {
-                "original_name": n.get("id"),
-                "type": (n.get("group") or "UNKNOWN"),
-                "count": (n.get("metadata") or {}).get("count", 1),
-            }
-            for n in nodes
-            if n.get("id")
-        }
-        
-        relationships = []
-        for e in edges:
-            # Handle both string IDs and object references
-            source_id = e.get("source")
-            target_id = e.get("target")
-            
-            # If source/target are objects, extract the 'id' field
-            if isinstance(source_id, dict):
-                source_id = source_id.get("id")
-            if isinstance(target_id, dict):
-                target_id = target_id.get("id")
-            
-            relationships.append({
-                "source": source_id,
-                "target": target_id,
-                "weight": e.get("value", 1.0),
-                "evidence": (e.get("metadata") or {}).get("all_evidence", [e.get("title", "")]),
-                "relationship_type": (e.get("metadata") or {}).get("relationship_type", "CO_OCCURRENCE"),
-            })
-        
-        graph_builder.build_graph(entities, relationships)
+        _rebuild_chat_graph(graph)
         
         # RAG: Try to get project_id and load RAG context
         project_id = (payload or {}).get("project_id")
@@ -1010,7 +1037,7 @@ async def chat_with_graph(
                 finally:
                     db.close()
                 
-                rag_index_path = f"uploads/{project_id}_rag_index.pkl"
+                rag_index_path = f"uploads/{project_id}_rag_index.json"
                 if rag_service.load_index(rag_index_path):
                     # Set graph context
                     rag_service.set_graph_context(graph_builder.graph, entities)
@@ -1193,6 +1220,48 @@ async def chat_with_graph(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/chat/stream")
+async def stream_chat_with_graph(
+    payload: dict,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Graph chat streamed as NDJSON: {"partial": text} lines carry the answer text
+    as it is generated, and a last {"final": ChatResponse} line the full result.
+    Document (RAG) context and chat history saving are only done by /api/chat.
+    """
+    message = (payload or {}).get("message", "")
+    conversation_history = (payload or {}).get("conversation_history", [])
+    try:
+        _rebuild_chat_graph((payload or {}).get("graph", {}))
+    except Exception as e:
+        print(f"Chat error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    agent = GraphConversationalAgent(graph_builder.graph, llm_service=llm_service)
+    
+    async def frames():
+        try:
+            async for frame in agent.chat_stream(message, conversation_history):
+                if "partial" in frame:
+                    yield json.dumps({"partial": frame["partial"]}) + "\n"
+                    continue
+                response = ChatResponse(
+                    answer=frame.get("answer", ""),
+                    citations=frame.get("citations", []),
+                    relevant_nodes=frame.get("relevant_nodes", []),
+                    relevant_edges=frame.get("relevant_edges", []),
+                    tool_calls=frame.get("tool_calls", []),
+                    source_documents=frame.get("source_documents", []),
+                )
+                yield json.dumps({"final": response.model_dump()}) + "\n"
+        except Exception as e:
+            print(f"Chat stream error: {e}")
+            yield json.dumps({"error": str(e)}) + "\n"
+    
+    return StreamingResponse(frames(), media_type="application/x-ndjson")
+
+
 @app.get("/api/projects/{project_id}/chat-history")
 async def get_chat_history(
     project_id: str,
@@ -1401,7 +1470,7 @@ async def generate_hypotheses(
         rag_context = None
         if project_id:
             try:
-                rag_index_path = f"uploads/{project_id}_rag_index.pkl"
+                rag_index_path = f"uploads/{project_id}_rag_index.json"
                 if rag_service.load_index(rag_index_path):
                     print(f"✓ Loaded RAG index from {rag_index_path}")
                     
@@ -1730,15 +1799,13 @@ async def export_project(
         
         # Export RAG index if it exists
         rag_index_data = None
-        rag_index_path = f"uploads/{project_id}_rag_index.pkl"
-        if os.path.exists(rag_index_path):
-            try:
-                import pickle
-                with open(rag_index_path, 'rb') as f:
-                    rag_index_data = pickle.load(f)
+        rag_index_path = f"uploads/{project_id}_rag_index.json"
+        try:
+            rag_index_data = read_index_metadata(rag_index_path)
+            if rag_index_data:
                 print(f"✓ Exported RAG index with {len(rag_index_data.get('document_chunks', {}))} documents")
-            except Exception as e:
-                print(f"⚠️  Failed to export RAG index: {e}")
+        except Exception as e:
+            print(f"⚠️  Failed to export RAG index: {e}")
         
         from app.models.schemas import ProjectExport
         return ProjectExport(
@@ -1826,10 +1893,8 @@ async def import_project(
         rag_index_data = settings.get("rag_index")
         if rag_index_data:
             try:
-                import pickle
-                rag_index_path = f"uploads/{project.id}_rag_index.pkl"
-                with open(rag_index_path, 'wb') as f:
-                    pickle.dump(rag_index_data, f)
+                rag_index_path = f"uploads/{project.id}_rag_index.json"
+                write_index_metadata(rag_index_path, rag_index_data)
                 print(f"✓ Imported RAG index with {len(rag_index_data.get('document_chunks', {}))} documents")
             except Exception as e:
                 print(f"⚠️  Failed to import RAG index: {e}")
@@ -1853,7 +1918,7 @@ async def import_project(
 async def discover_papers(req: PaperDiscoveryRequest):
     """Discover papers from PubMed and optionally process them"""
     try:
-        papers = pubmed_service.discover_and_fetch(req.query, req.max_results)
+        papers = (await pubmed_service.discover_and_fetch_many([req.query], req.max_results))[0]
         
         discovered = [
             DiscoveredPaper(**paper) for paper in papers if paper
@@ -2288,6 +2353,7 @@ async def save_agentic_research(
             document_chunker = DocumentChunker(chunk_size=500, overlap=100)
             rag_service = RAGService(llm_service=llm_service)
             graph_builder = GraphBuilder()
+            rag_documents = []  # (doc_id, chunks, entities), indexed together after the loop
             
             # Process each paper by downloading and processing like regular PDFs
             for i, (paper, doc) in enumerate(zip(papers, documents)):
@@ -2378,12 +2444,12 @@ async def save_agentic_research(
                                         doc_id=f"agentic_paper_{i+1}_{research_id}"
                                     )
                                     
-                                    # Index in RAG
-                                    rag_service.index_document(
-                                        doc_id=f"agentic_paper_{i+1}_{research_id}",
-                                        text_chunks=chunks,
-                                        entities=list(unique_entities.keys())
-                                    )
+                                    # Queue for RAG indexing (embedded together after the loop)
+                                    rag_documents.append((
+                                        f"agentic_paper_{i+1}_{research_id}",
+                                        chunks,
+                                        list(unique_entities.keys())
+                                    ))
                                     
                                     print(f"✅ Processed PDF {i+1}: {paper.get('title', 'Unknown')[:50]}...")
                                     continue
@@ -2444,12 +2510,12 @@ async def save_agentic_research(
                         doc_id=f"agentic_paper_{i+1}_{research_id}"
                     )
                     
-                    # Index in RAG
-                    rag_service.index_document(
-                        doc_id=f"agentic_paper_{i+1}_{research_id}",
-                        text_chunks=chunks,
-                        entities=list(unique_entities.keys())
-                    )
+                    # Queue for RAG indexing (embedded together after the loop)
+                    rag_documents.append((
+                        f"agentic_paper_{i+1}_{research_id}",
+                        chunks,
+                        list(unique_entities.keys())
+                    ))
                     
                     print(f"✅ Processed text file {i+1}: {paper.get('title', 'Unknown')[:50]}...")
                     
@@ -2457,8 +2523,11 @@ async def save_agentic_research(
                     print(f"❌ Error processing agentic paper {i+1}: {e}")
                     continue
             
+            # Index all papers in RAG, embedding their chunks in one batch
+            rag_service.bulk_index(rag_documents)
+            
             # Save combined RAG index
-            rag_index_path = f"uploads/{project.id}_rag_index.pkl"
+            rag_index_path = f"uploads/{project.id}_rag_index.json"
             rag_service.save_index(rag_index_path)
             
             db.commit()
@@ -2634,6 +2703,7 @@ async def process_agentic_research(
                 document_chunker = DocumentChunker(chunk_size=500, overlap=100)
                 rag_service = RAGService(llm_service=llm_service)
                 graph_builder = GraphBuilder()
+                rag_documents = []  # (doc_id, chunks, entities), indexed together after the loop
                 
                 # Process each paper by downloading and processing like regular PDFs
                 for i, (paper, doc) in enumerate(zip(papers, documents)):
@@ -2766,12 +2836,12 @@ async def process_agentic_research(
                                             entity_list
                                         )
                                         
-                                        # Index in RAG
-                                        rag_service.index_document(
-                                            doc_id=f"agentic_paper_{i+1}_{research_id}",
-                                            text_chunks=chunks,
-                                            entities=list(unique_entities.keys())
-                                        )
+                                        # Queue for RAG indexing (embedded together after the loop)
+                                        rag_documents.append((
+                                            f"agentic_paper_{i+1}_{research_id}",
+                                            chunks,
+                                            list(unique_entities.keys())
+                                        ))
                                         
                                         print(f"   ✅ Successfully processed FULL PDF {i+1} from {pdf_source}: {len(graph_data.nodes)} entities, {len(graph_data.edges)} relationships")
                                         continue
@@ -2857,12 +2927,12 @@ async def process_agentic_research(
                             entity_list
                         )
                         
-                        # Index in RAG
-                        rag_service.index_document(
-                            doc_id=f"agentic_paper_{i+1}_{research_id}",
-                            text_chunks=chunks,
-                            entities=list(unique_entities.keys())
-                        )
+                        # Queue for RAG indexing (embedded together after the loop)
+                        rag_documents.append((
+                            f"agentic_paper_{i+1}_{research_id}",
+                            chunks,
+                            list(unique_entities.keys())
+                        ))
                         
                         print(f"   ✅ Successfully processed abstract {i+1}: {len(graph_data.nodes)} entities, {len(graph_data.edges)} relationships")
                         
@@ -2870,8 +2940,11 @@ async def process_agentic_research(
                         print(f"❌ Error processing agentic paper {i+1}: {e}")
                         continue
                 
+                # Index all papers in RAG, embedding their chunks in one batch
+                rag_service.bulk_index(rag_documents)
+                
                 # Save combined RAG index
-                rag_index_path = f"uploads/{project.id}_rag_index.pkl"
+                rag_index_path = f"uploads/{project.id}_rag_index.json"
                 rag_service.save_index(rag_index_path)
                 
                 db.commit()
@@ -63,18 +63,13 @@ class AgenticAIService:
         search_queries = await self._generate_search_queries(research_topic, search_strategy)
         print(f"📝 Generated {len(search_queries)} search queries")
         
-        # Step 2: Search for papers with progress updates
+        # Step 2: Search for papers with progress updates (reported as each query's search finishes)
         all_papers = []
-        for i, query in enumerate(search_queries):
-            papers = await self._search_papers(query, max_papers // len(search_queries))
+        per_query = await self._search_papers_many(
+            search_queries, max_papers // len(search_queries), progress_callback
+        )
+        for papers in per_query:
             all_papers.extend(papers)
-            
-            # Update progress after each query
-            if progress_callback:
-                progress_callback({
-                    "papers_found": len(all_papers),
-                    "current_stage": f"Searching... ({i+1}/{len(search_queries)} queries complete)"
-                })
         
         # Remove duplicates and limit
         unique_papers = self._deduplicate_papers(all_papers)[:max_papers]
@@ -156,16 +151,50 @@ class AgenticAIService:
             print(f"Failed to generate search queries: {e}")
             return [research_topic]
     
-    async def _search_papers(self, query: str, max_results: int) -> List[Dict[str, Any]]:
-        """Search for papers using PubMed and enrich with Google Scholar PDF links"""
+    async def _search_papers_many(
+        self,
+        queries: List[str],
+        max_results: int,
+        progress_callback = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search PubMed for several queries concurrently and enrich with Google Scholar PDF links.
+        progress_callback, if given, is updated as each query's search finishes.
+        """
+        found_pmids = set()
+        completed = 0
+        
+        def on_search_done(_, pmids: List[str]):
+            nonlocal completed
+            completed += 1
+            found_pmids.update(pmids)
+            progress_callback({
+                "papers_found": len(found_pmids),
+                "current_stage": f"Searching... ({completed}/{len(queries)} queries complete)"
+            })
+        
+        try:
+            per_query = await self.pubmed_service.discover_and_fetch_many(
+                queries, max_results, on_search_done if progress_callback else None
+            )
+        except Exception as e:
+            print(f"Error searching papers for queries {queries}: {e}")
+            return [[] for _ in queries]
+        
+        # Papers shared between queries are the same dicts, so enrich each once
+        seen = set()
+        unique = []
+        for papers in per_query:
+            for paper in papers:
+                if id(paper) not in seen:
+                    seen.add(id(paper))
+                    unique.append(paper)
+        self._enrich_with_scholar(unique)
+        return per_query
+    
+    def _enrich_with_scholar(self, papers: List[Dict[str, Any]]):
+        """For papers without PDF links, try Google Scholar"""
         try:
-            # Search PubMed
-            pmids = self.pubmed_service.search(query, max_results)
-            
-            # Fetch abstracts for all PMIDs at once
-            papers = self.pubmed_service.fetch_abstracts(pmids)
-            
-            # For papers without PDF links, try Google Scholar
             print(f"🔍 Enriching {len(papers)} papers with Google Scholar PDF links...")
             for paper in papers:
                 if not paper.get('pdf_url') and not paper.get('pmc_id'):
@@ -181,11 +210,8 @@ class AgenticAIService:
                             print(f"   ✓ Found PDF on Google Scholar: {paper.get('title', '')[:50]}")
                     except Exception as e:
                         print(f"   ⚠️ Google Scholar lookup failed for: {paper.get('title', '')[:50]} - {e}")
-            
-            return papers
         except Exception as e:
-            print(f"Error searching papers for query '{query}': {e}")
-            return []
+            print(f"Error enriching papers with Google Scholar: {e}")
     
     def _deduplicate_papers(self, papers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Remove duplicate papers based on PMID or title"""
@@ -394,8 +420,9 @@ class AgenticAIService:
         
         # Search for papers using key terms
         related_papers = []
-        for term in key_terms[:5]:  # Limit to avoid too many searches
-            papers = await self._search_papers(term, max_new_papers // len(key_terms))
-            related_papers.extend(papers)
+        terms = key_terms[:5]  # Limit to avoid too many searches
+        if terms:
+            for papers in await self._search_papers_many(terms, max_new_papers // len(key_terms)):
+                related_papers.extend(papers)
         
         return self._deduplicate_papers(related_papers)[:max_new_papers]
@@ -1,6 +1,105 @@
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Tuple, Optional, AsyncIterator, Iterator
+from bisect import bisect_right
+from itertools import islice
+from collections import Counter, defaultdict
+from functools import partial, reduce
+from operator import itemgetter
+import weakref
 import networkx as nx
+import numpy as np
 import json
+import re
+
+# Optional multi-pattern matcher for entity lookup
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+_EMPTY = ()
+# Separates lowercased node names in the substring-search haystack
+_NAME_SEP = "\x00"
+
+# Direction-optimizing BFS (Beamer et al.): switch to a bottom-up step once the
+# frontier's edges exceed the still-unexplored edges divided by this factor
+_BOTTOM_UP_ALPHA = 14
+
+# Entities listed in the chat prompt as a sample of the graph
+_PROMPT_SAMPLE_SIZE = 20
+
+# Body of a JSON string literal up to (not including) its closing quote
+_JSON_STRING_BODY = re.compile(r'(?:[^"\\]|\\.)*', re.DOTALL)
+
+
+class _GraphViews:
+    """Lookup structures derived from one state of a graph, built lazily and shared by all agents"""
+
+    def __init__(self, key: Tuple[Any, int]):
+        self.key = key
+        self.nodes: Optional[Tuple[str, ...]] = None
+        self.lowers: Optional[Tuple[str, ...]] = None
+        self.stats: Optional[Dict[str, Any]] = None
+        self.csr: Optional[Tuple] = None
+        self.match: Optional[Tuple] = None
+
+
+# An agent is created per chat request, so derived views live here, per graph
+# object, rather than on the agent. GraphBuilder only bumps the graph's revision
+# when a rebuild changes its content, so identical rebuilds keep their views.
+_GRAPH_VIEWS: "weakref.WeakKeyDictionary[nx.Graph, _GraphViews]" = weakref.WeakKeyDictionary()
+
+
+def _graph_views(graph: nx.Graph) -> _GraphViews:
+    """Shared views for the graph's current state"""
+    key = (graph.graph.get("revision"), graph.number_of_nodes())
+    views = _GRAPH_VIEWS.get(graph)
+    if views is None or views.key != key:
+        views = _GRAPH_VIEWS[graph] = _GraphViews(key)
+    return views
+
+
+class _StreamedStringField:
+    """Decodes one JSON string field of a reply as it streams in, so callers can forward just that text"""
+
+    def __init__(self, key: str):
+        self._start_re = re.compile(r'"%s"\s*:\s*"' % re.escape(key))
+        self._buffer = ""
+        self._start: Optional[int] = None
+        self._emitted = 0
+        self._done = False
+
+    def feed(self, text: str) -> str:
+        """Append a chunk of the reply and return the newly decoded part of the field"""
+        self._buffer += text
+        if self._done:
+            return ""
+        if self._start is None:
+            match = self._start_re.search(self._buffer)
+            if not match:
+                return ""
+            self._start = match.end()
+        raw = self._buffer[self._start:]
+        end = _JSON_STRING_BODY.match(raw).end()
+        if end < len(raw) and raw[end] == '"':
+            raw = raw[:end]
+            self._done = True
+        value = None
+        # An escape sequence may be cut off at the end of the chunk
+        for cut in range(1 if self._done else 6):
+            try:
+                value = json.loads('"' + raw[:len(raw) - cut] + '"')
+                break
+            except ValueError:
+                continue
+        if value is None:
+            return ""
+        if not self._done and value and "\ud800" <= value[-1] <= "\udbff":
+            # Wait for the low half of a surrogate pair
+            value = value[:-1]
+        new_text = value[self._emitted:]
+        self._emitted = len(value)
+        return new_text
 
 
 class GraphConversationalAgent:
@@ -15,63 +114,267 @@ class GraphConversationalAgent:
         self.llm_service = llm_service
         self.conversation_history = []
 
+    @property
+    def _nodes(self) -> Tuple[str, ...]:
+        """Snapshot of the graph's nodes, reused until the graph changes"""
+        views = _graph_views(self.graph)
+        if views.nodes is None:
+            views.nodes = tuple(self.graph.nodes())
+        return views.nodes
+
+    @property
+    def _node_lowers(self) -> Tuple[str, ...]:
+        """Lowercased node names aligned with _nodes"""
+        views = _graph_views(self.graph)
+        if views.lowers is None:
+            views.lowers = tuple(n.lower() for n in self._nodes)
+        return views.lowers
+
+    def _graph_stats(self) -> Dict[str, Any]:
+        """Node/edge counts and a sample of entity names for the chat prompt, reused until the graph changes"""
+        views = _graph_views(self.graph)
+        if views.stats is None:
+            views.stats = {
+                "num_nodes": self.graph.number_of_nodes(),
+                "num_edges": self.graph.number_of_edges(),
+                "sample_entities": list(islice(self.graph.nodes(), _PROMPT_SAMPLE_SIZE))
+            }
+        return views.stats
+
+    def _build_csr(self):
+        """
+        Build a CSR view of the adjacency, reused until the graph changes.
+        Row i of `_nbrs` holds the sorted neighbor ids of node i; `_ew`, `_etype`
+        and `_evid` are parallel per-edge arrays of weight, type and evidence.
+        """
+        views = _graph_views(self.graph)
+        if views.csr is None:
+            views.csr = self._csr_arrays()
+        (self._idx_node, self._node_idx, self._offsets, self._deg,
+         self._nbrs, self._ew, self._etype, self._evid) = views.csr
+
+    def _csr_arrays(self) -> Tuple:
+        """The arrays _build_csr exposes, in its unpacking order"""
+        idx_node = self._nodes
+        node_idx = {n: i for i, n in enumerate(idx_node)}
+        offsets = np.zeros(len(idx_node) + 1, dtype=np.int64)
+        nbrs, ew, etype, evid = [], [], [], []
+        adj = self.graph.adj
+        for i, node in enumerate(idx_node):
+            row = sorted(((node_idx[v], d) for v, d in adj[node].items()), key=itemgetter(0))
+            for j, data in row:
+                get = data.get
+                nbrs.append(j)
+                ew.append(get("weight", 1.0))
+                etype.append(get("relationship_type", "CO_OCCURRENCE"))
+                evid.append(get("evidence", _EMPTY))
+            offsets[i + 1] = len(nbrs)
+        
+        return (
+            idx_node, node_idx, offsets, np.diff(offsets),
+            np.asarray(nbrs, dtype=np.int32), np.asarray(ew, dtype=np.float64), etype, evid,
+        )
+
+    def _row(self, i: int) -> np.ndarray:
+        """Sorted neighbor ids of node index i"""
+        return self._nbrs[self._offsets[i]:self._offsets[i + 1]]
+
+    def _bfs_levels(self, seeds: List[int], depth: int) -> List[Dict[int, Tuple[int, int]]]:
+        """
+        Direction-optimizing BFS over the CSR arrays (call _build_csr first).
+        Returns one dict per level mapping each newly reached node id to
+        (parent id, CSR position of the connecting edge). Stops early, after
+        appending an empty level, once nothing new is reachable.
+        """
+        offsets, nbrs, deg = self._offsets, self._nbrs, self._deg
+        n = len(self._idx_node)
+        visited = bytearray(n)
+        # Writable numpy view of the same bytes for the vectorized bottom-up steps
+        visited_mask = np.frombuffer(visited, dtype=np.uint8)
+        frontier = list(dict.fromkeys(seeds))
+        for i in frontier:
+            visited[i] = 1
+        unexplored = int(deg.sum()) - int(deg[frontier].sum())
+        
+        levels = []
+        for _ in range(depth):
+            level = {}
+            if int(deg[frontier].sum()) * _BOTTOM_UP_ALPHA > unexplored:
+                # Bottom-up: every unvisited node takes its first frontier
+                # neighbor (in CSR order) as parent, checked for all rows at once
+                in_frontier = np.zeros(n, dtype=bool)
+                in_frontier[frontier] = True
+                positions, rows = self._gather_rows(np.flatnonzero(visited_mask == 0))
+                hits = in_frontier[nbrs[positions]]
+                positions, rows = positions[hits], rows[hits]
+                # Positions are grouped by row, so each row's first hit is its parent
+                found, first = np.unique(rows, return_index=True)
+                positions = positions[first]
+                level = dict(zip(found.tolist(), zip(nbrs[positions].tolist(), positions.tolist())))
+                visited_mask[found] = 1
+            else:
+                # Top-down: expand only the nodes discovered on the previous level
+                for i in frontier:
+                    lo = int(offsets[i])
+                    for pos, j in enumerate(nbrs[lo:offsets[i + 1]].tolist(), lo):
+                        if not visited[j]:
+                            visited[j] = 1
+                            level[j] = (i, pos)
+            levels.append(level)
+            frontier = list(level)
+            if not frontier:
+                break
+            unexplored -= int(deg[frontier].sum())
+        return levels
+
+    def _gather_rows(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """CSR positions of every edge in the given rows, with the row id of each position"""
+        counts = self._deg[rows]
+        ends = np.cumsum(counts)
+        positions = np.arange(ends[-1] if len(ends) else 0, dtype=np.int64)
+        positions += np.repeat(self._offsets[rows] - (ends - counts), counts)
+        return positions, np.repeat(rows, counts)
+
+    def _reach_mask(self, seeds: np.ndarray, depth: int) -> np.ndarray:
+        """Boolean mask of nodes within `depth` hops of the seeds (vectorized level-synchronous BFS)"""
+        visited = np.zeros(len(self._idx_node), dtype=bool)
+        frontier = np.unique(seeds)
+        visited[frontier] = True
+        for _ in range(depth):
+            reached = self._nbrs[self._gather_rows(frontier)[0]]
+            frontier = np.unique(reached[~visited[reached]])
+            if not len(frontier):
+                break
+            visited[frontier] = True
+        return visited
+
     def get_neighbors(self, entity: str, depth: int = 1) -> Dict[str, Any]:
         if entity not in self.graph:
             return {"entity": entity, "neighbors": []}
         
-        visited = {entity}
-        frontier = {entity}
+        self._build_csr()
+        idx_node, ew, etype, evid = self._idx_node, self._ew, self._etype, self._evid
+        
         layers = []
-        for _ in range(max(1, depth)):
-            next_frontier = set()
-            layer = []
-            for node in frontier:
-                for neighbor in self.graph.neighbors(node):
-                    if neighbor in visited:
-                        continue
-                    visited.add(neighbor)
-                    next_frontier.add(neighbor)
-                    edge = self.graph.edges[node, neighbor]
-                    layer.append({
-                        "source": node,
-                        "target": neighbor,
-                        "weight": edge.get("weight", 1.0),
-                        "relationship_type": edge.get("relationship_type", "CO_OCCURRENCE"),
-                        "evidence": edge.get("evidence", [])[:3],
-                    })
-            layers.append(layer)
-            frontier = next_frontier
-            if not frontier:
-                break
+        for level in self._bfs_levels([self._node_idx[entity]], max(1, depth)):
+            layers.append([
+                {
+                    "source": idx_node[parent],
+                    "target": idx_node[j],
+                    "weight": float(ew[pos]),
+                    "relationship_type": etype[pos],
+                    "evidence": evid[pos][:3],
+                }
+                for j, (parent, pos) in level.items()
+            ])
         
         return {"entity": entity, "layers": layers}
 
-    def shortest_path(self, source: str, target: str, k_paths: int = 1) -> Dict[str, Any]:
-        """Find shortest path using Dijkstra's algorithm with edge weights"""
+    def _bidir_bfs(self, src: int, tgt: int) -> Optional[Tuple[int, Dict[int, List[int]], Dict[int, List[int]], List[int]]]:
+        """
+        Bidirectional BFS between two node ids over the CSR arrays, always expanding
+        the smaller frontier. Returns (hops, pred_fwd, pred_bwd, meets): the pred dicts
+        hold every shortest-path predecessor explored from each side and `meets` are
+        the nodes where shortest paths cross between them. None if unreachable.
+        """
+        if src == tgt:
+            return 0, {src: []}, {tgt: []}, [src]
+        
+        offsets, nbrs = self._offsets, self._nbrs
+        pred = [{src: []}, {tgt: []}]
+        dist = [{src: 0}, {tgt: 0}]
+        fronts = [[src], [tgt]]
+        while fronts[0] and fronts[1]:
+            side = 0 if len(fronts[0]) <= len(fronts[1]) else 1
+            own_pred, own_dist, other_dist = pred[side], dist[side], dist[1 - side]
+            d = own_dist[fronts[side][0]] + 1
+            level = {}
+            for u in fronts[side]:
+                for v in nbrs[offsets[u]:offsets[u + 1]].tolist():
+                    if v in own_dist:
+                        continue
+                    if v in level:
+                        level[v].append(u)
+                    else:
+                        level[v] = [u]
+            own_pred.update(level)
+            for v in level:
+                own_dist[v] = d
+            fronts[side] = list(level)
+            
+            meets = [v for v in level if v in other_dist]
+            if meets:
+                hops = min(d + other_dist[v] for v in meets)
+                meets = [v for v in meets if d + other_dist[v] == hops]
+                return hops, pred[0], pred[1], meets
+        return None
+
+    @staticmethod
+    def _iter_pred_paths(pred: Dict[int, List[int]], end: int):
+        """Yield root-to-end paths through a predecessor DAG using an iterator stack"""
+        stack = [(end, iter(pred[end]))]
+        while stack:
+            node, parents = stack[-1]
+            if not pred[node]:
+                yield [n for n, _ in reversed(stack)]
+                stack.pop()
+                continue
+            parent = next(parents, None)
+            if parent is None:
+                stack.pop()
+            else:
+                stack.append((parent, iter(pred[parent])))
+
+    def _iter_hop_paths(self, hops: int, pred_fwd: Dict[int, List[int]], pred_bwd: Dict[int, List[int]], meets: List[int]):
+        """Lazily yield every fewest-hop path found by _bidir_bfs as node-id lists"""
+        for v in meets:
+            for head in self._iter_pred_paths(pred_fwd, v):
+                for tail in self._iter_pred_paths(pred_bwd, v):
+                    yield head + tail[-2::-1]
+
+    def shortest_path(self, source: str, target: str, k_paths: int = 1, cutoff: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Find shortest path using bidirectional Dijkstra with edge weights.
+        Paths weighing more than `cutoff`, when given, are not returned. With
+        k_paths > 1 the weighted path is followed by alternative fewest-hop paths.
+        """
         if source not in self.graph or target not in self.graph:
             return {"paths": []}
         try:
             # Use Dijkstra's algorithm: shortest path by weight (not hop count)
-            # NetworkX uses Dijkstra by default for weighted graphs
-            path = nx.shortest_path(self.graph, source=source, target=target, weight='weight')
-            paths = [path]  # Just return the single shortest weighted path
+            length, path = nx.bidirectional_dijkstra(self.graph, source, target, weight='weight')
         except (nx.NetworkXNoPath, nx.NodeNotFound):
             return {"paths": []}
+        if cutoff is not None and length > cutoff:
+            return {"paths": []}
+        
+        paths = [path]
+        if k_paths > 1:
+            self._build_csr()
+            idx_node = self._idx_node
+            search = self._bidir_bfs(self._node_idx[source], self._node_idx[target])
+            for ids in self._iter_hop_paths(*search):
+                alternative = [idx_node[i] for i in ids]
+                if alternative != path:
+                    paths.append(alternative)
+                if len(paths) >= k_paths:
+                    break
         
         detailed = []
+        adj = self.graph.adj
         for path in paths:
             edges = []
             total_weight = 0
             for a, b in zip(path, path[1:]):
-                data = self.graph.edges[a, b]
-                weight = data.get("weight", 1.0)
+                get = adj[a][b].get
+                weight = get("weight", 1.0)
                 total_weight += weight
                 edges.append({
                     "source": a,
                     "target": b,
                     "weight": weight,
-                    "relationship_type": data.get("relationship_type", "CO_OCCURRENCE"),
-                    "evidence": data.get("evidence", [])[:3],
+                    "relationship_type": get("relationship_type", "CO_OCCURRENCE"),
+                    "evidence": get("evidence", _EMPTY)[:3],
                 })
             detailed.append({
                 "nodes": path, 
@@ -84,30 +387,42 @@ class GraphConversationalAgent:
         present = [e for e in entities if e in self.graph]
         if len(present) < 2:
             return {"common": []}
-        neighbor_sets = [set(self.graph.neighbors(e)) for e in present]
-        common = set.intersection(*neighbor_sets) if neighbor_sets else set()
-        result = []
-        for n in common:
-            deg = self.graph.degree(n)
-            if deg >= min_degree:
-                result.append({"entity": n, "degree": deg})
-        result.sort(key=lambda x: x["degree"], reverse=True)
+        self._build_csr()
+        rows = [self._row(self._node_idx[e]) for e in present]
+        if len(rows) == 2:
+            common_idx = np.intersect1d(rows[0], rows[1], assume_unique=True)
+        else:
+            common_idx = reduce(partial(np.intersect1d, assume_unique=True), rows)
+        degrees = self._deg[common_idx]
+        keep = degrees >= min_degree
+        common_idx, degrees = common_idx[keep], degrees[keep]
+        order = np.argsort(-degrees, kind="stable")
+        idx_node = self._idx_node
+        result = [
+            {"entity": idx_node[i], "degree": d}
+            for i, d in zip(common_idx[order].tolist(), degrees[order].tolist())
+        ]
         return {"common": result}
 
     def subgraph(self, center_entities: List[str], depth: int = 1) -> Dict[str, Any]:
-        nodes_to_include = set(center_entities)
-        for e in center_entities:
-            if e not in self.graph:
-                continue
-            for _ in range(depth):
-                neighbors = set()
-                for n in nodes_to_include.copy():
-                    if n in self.graph:
-                        neighbors.update(self.graph.neighbors(n))
-                nodes_to_include.update(neighbors)
-        sg = self.graph.subgraph(nodes_to_include).copy()
-        nodes = list(sg.nodes())
-        edges = [[u, v] for u, v in sg.edges()]
+        present = [e for e in center_entities if e in self.graph]
+        if not present:
+            return {"nodes": [], "edges": []}
+        
+        self._build_csr()
+        node_idx, idx_node = self._node_idx, self._idx_node
+        seeds = np.fromiter((node_idx[e] for e in present), dtype=np.int64, count=len(present))
+        in_sub = self._reach_mask(seeds, max(0, depth))
+        
+        # Induced edges: CSR entries of member rows whose other end is also a
+        # member, each undirected edge kept once from its lower endpoint
+        rows = np.flatnonzero(in_sub)
+        positions, src = self._gather_rows(rows)
+        dst = self._nbrs[positions]
+        keep = in_sub[dst] & (src <= dst)
+        
+        nodes = [idx_node[i] for i in rows.tolist()]
+        edges = [[idx_node[u], idx_node[v]] for u, v in zip(src[keep].tolist(), dst[keep].tolist())]
         return {"nodes": nodes, "edges": edges}
     
     async def chat(self, user_message: str, conversation_history: Optional[List[Dict]] = None) -> Dict[str, Any]:
@@ -115,22 +430,37 @@ class GraphConversationalAgent:
         Conversational interface for graph queries
         Uses pattern matching first, falls back to LLM for complex queries
         """
+        result = None
+        async for frame in self.chat_stream(user_message, conversation_history):
+            if "partial" not in frame:
+                result = frame
+        return result
+
+    async def chat_stream(
+        self,
+        user_message: str,
+        conversation_history: Optional[List[Dict]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of chat.
+        Yields {"partial": text} frames with the answer text while a direct LLM
+        answer arrives (tool plans are not streamed), then a final
+        response dict with the same shape chat() returns.
+        """
         # Try pattern matching first (fast, no cost)
         pattern_result = self._try_pattern_match(user_message)
         if pattern_result:
-            return pattern_result
+            yield pattern_result
+            return
         
         # If pattern matching failed and LLM is available, use it
         if not self.llm_service or not self.llm_service.enabled:
             # No LLM and pattern matching failed
-            return self._pattern_match_chat(user_message)
+            yield self._pattern_match_chat(user_message)
+            return
         
         # Prepare graph context
-        graph_stats = {
-            "num_nodes": self.graph.number_of_nodes(),
-            "num_edges": self.graph.number_of_edges(),
-            "sample_entities": list(self.graph.nodes())[:20]
-        }
+        graph_stats = self._graph_stats()
         
         # Build system prompt with available tools
         system_prompt = f"""You are a biomedical knowledge graph assistant. You help users explore relationships between biomedical entities.
@@ -159,10 +489,8 @@ If no tool is needed, return:
   "response": "Your direct answer"
 }}"""
 
-        # Prepare messages
-        messages = [
-            {"role": "system", "content": system_prompt},
-        ]
+        # Prepare messages (the system prompt is passed separately)
+        messages = []
         
         # Add conversation history if provided
         if conversation_history:
@@ -179,20 +507,21 @@ If no tool is needed, return:
         
         try:
             # Use direct Anthropic API
-            if self.llm_service.anthropic_client:
-                import asyncio
-                response = await asyncio.to_thread(
-                    self.llm_service.anthropic_client.messages.create,
-                    model="claude-3-5-sonnet-20241022",
-                    max_tokens=4000,
-                    messages=messages
-                )
-                content = response.content[0].text
-            else:
-                return self._pattern_match_chat(user_message)
+            if not self.llm_service.anthropic_client:
+                yield self._pattern_match_chat(user_message)
+                return
+            
+            chunks: List[str] = []
+            # Only a direct answer is shown while it streams, never the tool plan
+            answer_text = _StreamedStringField("response")
+            async for text in self._stream_llm(system_prompt, messages):
+                chunks.append(text)
+                partial_answer = answer_text.feed(text)
+                if partial_answer:
+                    yield {"partial": partial_answer}
             
-            # Parse LLM response
-            llm_result = json.loads(content)
+            # Parse LLM response once the stream has ended
+            llm_result = json.loads("".join(chunks))
             
             # If LLM wants to use a tool, execute it
             if llm_result.get("tool"):
@@ -221,10 +550,10 @@ If no tool is needed, return:
                     result = {"error": "Unknown tool"}
                 
                 # Format result for user
-                return self._format_tool_result(tool_name, result, llm_result.get("explanation", ""))
+                final = self._format_tool_result(tool_name, result, llm_result.get("explanation", ""))
             else:
                 # Direct response from LLM
-                return {
+                final = {
                     "answer": llm_result.get("response", "I'm not sure how to help with that."),
                     "tool_calls": [],
                     "relevant_nodes": [],
@@ -233,71 +562,151 @@ If no tool is needed, return:
                 }
                 
         except Exception as e:
-            return self._pattern_match_chat(user_message)
+            final = self._pattern_match_chat(user_message)
+        
+        yield final
+    
+    async def _stream_llm(self, system_prompt: str, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """
+        Stream reply text from the async Anthropic client.
+        Holds a slot of the LLM service's stream semaphore (shared by every agent
+        using that service) for the duration of the stream so concurrent chats
+        cannot pile unbounded requests onto the API.
+        """
+        async with self.llm_service.stream_semaphore():
+            async with self.llm_service.anthropic_client.messages.stream(
+                model="claude-3-5-sonnet-20241022",
+                max_tokens=4000,
+                system=system_prompt,
+                messages=messages
+            ) as stream:
+                async for text in stream.text_stream:
+                    yield text
     
+    def _build_match_index(self):
+        """
+        Build lowercased lookup structures over node names, reused until the graph changes:
+        first index per lowercased name, a joined haystack for substring search,
+        an inverted word index, and an Aho-Corasick automaton when available.
+        """
+        views = _graph_views(self.graph)
+        if views.match is None:
+            views.match = self._match_structures()
+        (self._match_nodes, self._match_lowers, self._first_idx, self._word_index,
+         self._word_counts, self._name_starts, self._haystack, self._automaton) = views.match
+
+    def _match_structures(self) -> Tuple:
+        """The structures _build_match_index exposes, in its unpacking order"""
+        nodes = self._nodes
+        lowers = self._node_lowers
+        first_idx: Dict[str, int] = {}
+        word_index: Dict[str, List[int]] = defaultdict(list)
+        word_counts = []
+        starts = []
+        pos = 0
+        for i, low in enumerate(lowers):
+            first_idx.setdefault(low, i)
+            words = set(low.split())
+            word_counts.append(len(words))
+            for word in words:
+                word_index[word].append(i)
+            starts.append(pos)
+            pos += len(low) + len(_NAME_SEP)
+        
+        automaton = None
+        if AHOCORASICK_AVAILABLE:
+            automaton = ahocorasick.Automaton()
+            for low in first_idx:
+                if low:
+                    automaton.add_word(low, low)
+            automaton.make_automaton()
+        
+        return (
+            nodes, lowers, first_idx, word_index,
+            word_counts, starts, _NAME_SEP.join(lowers), automaton,
+        )
+
+    def _nodes_containing(self, query_lower: str) -> Iterator[int]:
+        """Indices of nodes whose lowercased name contains query_lower"""
+        if not query_lower or _NAME_SEP in query_lower:
+            return
+        haystack, starts = self._haystack, self._name_starts
+        pos = haystack.find(query_lower)
+        while pos != -1:
+            i = bisect_right(starts, pos) - 1
+            yield i
+            if i + 1 >= len(starts):
+                break
+            pos = haystack.find(query_lower, starts[i + 1])
+
+    def _nodes_within(self, query_lower: str) -> List[int]:
+        """First indices of lowercased node names that occur inside query_lower"""
+        if self._automaton is not None and query_lower:
+            found = {low for _, low in self._automaton.iter(query_lower)}
+        else:
+            found = {low for low in self._first_idx if low and low in query_lower}
+        return [self._first_idx[low] for low in found]
+
     def _match_entities(self, query_entities: List[str]) -> List[str]:
         """Match query entities to actual graph nodes with fuzzy matching"""
+        self._build_match_index()
+        nodes, lowers = self._match_nodes, self._match_lowers
         matched = []
-        graph_nodes = list(self.graph.nodes())
         
         for query_entity in query_entities:
             query_lower = query_entity.lower().strip()
-            best_match = None
-            best_score = 0
             
             # Try exact match first
-            for node in graph_nodes:
-                if node.lower() == query_lower:
-                    matched.append(node)
-                    break
-            else:
-                # Try substring match
-                for node in graph_nodes:
-                    node_lower = node.lower()
-                    if query_lower in node_lower:
-                        score = len(query_lower) / len(node_lower)
-                        if score > best_score:
-                            best_score = score
-                            best_match = node
-                    elif node_lower in query_lower:
-                        score = len(node_lower) / len(query_lower)
-                        if score > best_score:
-                            best_score = score
-                            best_match = node
-                
-                # Try fuzzy matching by checking if words overlap
-                if not best_match:
-                    query_words = set(query_lower.split())
-                    for node in graph_nodes:
-                        node_words = set(node.lower().split())
-                        overlap = query_words & node_words
-                        if overlap:
-                            score = len(overlap) / max(len(query_words), len(node_words))
-                            if score > best_score:
-                                best_score = score
-                                best_match = node
-                
-                if best_match and best_score > 0.3:  # At least 30% similarity
-                    matched.append(best_match)
+            exact = self._first_idx.get(query_lower)
+            if exact is not None:
+                matched.append(nodes[exact])
+                continue
+            
+            # Try substring match; ties go to the node that comes first in the graph
+            candidates = [
+                (len(query_lower) / len(lowers[i]), -i) for i in self._nodes_containing(query_lower)
+            ]
+            if query_lower:
+                candidates.extend(
+                    (len(lowers[i]) / len(query_lower), -i) for i in self._nodes_within(query_lower)
+                )
+            candidates = [c for c in candidates if c[0] > 0]
+            
+            # Try fuzzy matching by checking if words overlap
+            if not candidates:
+                query_words = set(query_lower.split())
+                overlaps = Counter()
+                for word in query_words:
+                    overlaps.update(self._word_index.get(word, _EMPTY))
+                candidates = [
+                    (overlap / max(len(query_words), self._word_counts[i]), -i)
+                    for i, overlap in overlaps.items()
+                ]
+            
+            if candidates:
+                best_score, neg_idx = max(candidates)
+                if best_score > 0.3:  # At least 30% similarity
+                    matched.append(nodes[-neg_idx])
         
         return matched
     
     def _find_similar_entities(self, query: str, limit: int = 5) -> List[str]:
         """Find similar entities for suggestions"""
         query_lower = query.lower().strip()
-        graph_nodes = list(self.graph.nodes())
+        query_words = query_lower.split()
         suggestions = []
         
-        for node in graph_nodes:
-            node_lower = node.lower()
+        for node, node_lower in zip(self._nodes, self._node_lowers):
+            if len(suggestions) >= limit:
+                break
             # Check if any words match
-            if any(word in node_lower for word in query_lower.split()):
+            if any(word in node_lower for word in query_words):
                 suggestions.append(node)
             # Check if starts with same letter
             elif query_lower and node_lower.startswith(query_lower[0]):
                 suggestions.append(node)
         
-        return suggestions[:limit]
+        return suggestions
     
     def _format_tool_result(self, tool_name: str, result: Dict, explanation: str) -> Dict[str, Any]:
         """Format tool execution result for chat response"""
@@ -493,8 +902,6 @@ If no tool is needed, return:
         print(f"   Lowercased text: '{text}'")
         
         # Extract entity names from common patterns
-        graph_nodes = list(self.graph.nodes())
-        
         # Pattern: "neighbors of X" or "what are neighbors of X"
         if "neighbor" in text:
             print(f"   ✅ Detected 'neighbor' pattern")
@@ -1,15 +1,73 @@
 import networkx as nx
-from typing import List, Dict, Any, Tuple
-from collections import defaultdict
+import numpy as np
+import heapq
+from operator import itemgetter
+from typing import List, Dict, Any, Tuple, Optional
+from collections import Counter, OrderedDict
+import threading
 import community.community_louvain as community_louvain
+from app.config import settings
 from app.models.schemas import Node, Edge, GraphData, EntityType, GraphAnalytics
 
+# Optional Rust-backed graph algorithms
+try:
+    import rustworkx as rx
+    RUSTWORKX_AVAILABLE = True
+except ImportError:
+    RUSTWORKX_AVAILABLE = False
+
+# Optional C-backed community detection
+try:
+    import igraph as ig
+    IGRAPH_AVAILABLE = True
+except ImportError:
+    IGRAPH_AVAILABLE = False
+
+
+# Betweenness centrality memo shared across GraphBuilder instances. Keyed by
+# topology, so rebuilding an identical graph (as every analytics request does)
+# reuses the previous O(V*E) Brandes run.
+_BETWEENNESS_CACHE: "OrderedDict[Tuple[int, ...], Dict[str, float]]" = OrderedDict()
+_BETWEENNESS_CACHE_SIZE = 8
+_BETWEENNESS_LOCK = threading.Lock()
+
+
+def _betweenness_centrality(graph: nx.Graph) -> Dict[str, float]:
+    """Betweenness centrality memoized on the graph's node and edge sets"""
+    key = (
+        graph.number_of_nodes(),
+        graph.number_of_edges(),
+        hash(frozenset(graph.nodes())),
+        hash(frozenset(map(frozenset, graph.edges()))),
+    )
+    with _BETWEENNESS_LOCK:
+        cached = _BETWEENNESS_CACHE.get(key)
+        if cached is not None:
+            _BETWEENNESS_CACHE.move_to_end(key)
+            return cached
+    
+    if RUSTWORKX_AVAILABLE and settings.enable_rustworkx:
+        # Exact Brandes in native code; node payloads are the networkx node ids
+        rx_graph = rx.networkx_converter(graph)
+        scores = rx.betweenness_centrality(rx_graph, normalized=True)
+        centrality = {rx_graph[idx]: value for idx, value in scores.items()}
+    else:
+        centrality = nx.betweenness_centrality(graph)
+    
+    with _BETWEENNESS_LOCK:
+        _BETWEENNESS_CACHE[key] = centrality
+        if len(_BETWEENNESS_CACHE) > _BETWEENNESS_CACHE_SIZE:
+            _BETWEENNESS_CACHE.popitem(last=False)
+    return centrality
+
 
 class GraphBuilder:
     """Build and analyze knowledge graphs from extracted entities and relationships"""
     
     def __init__(self):
         self.graph = nx.Graph()
+        self._revision = 0
+        self._content_hash = None
     
     def build_graph(
         self,
@@ -18,6 +76,7 @@ class GraphBuilder:
     ) -> GraphData:
         """Build a graph from entities and relationships"""
         self.graph.clear()
+        content = []
         
         # Add nodes
         nodes = []
@@ -28,9 +87,13 @@ class GraphBuilder:
                 entity_type=entity_data["type"],
                 count=entity_data["count"]
             )
+            content.append((node_id, entity_data["type"], entity_data["count"]))
         
         # Add edges
         edges = []
+        # The same sentence is usually evidence for many entity pairs; share one
+        # string object per distinct sentence across all edges of this build
+        evidence_pool: Dict[str, str] = {}
         for rel in relationships:
             source = rel["source"]
             target = rel["target"]
@@ -40,6 +103,8 @@ class GraphBuilder:
             
             # Only add edge if both nodes exist
             if self.graph.has_node(source) and self.graph.has_node(target):
+                if isinstance(evidence, list):
+                    evidence = [evidence_pool.setdefault(sentence, sentence) for sentence in evidence]
                 self.graph.add_edge(
                     source,
                     target,
@@ -47,10 +112,24 @@ class GraphBuilder:
                     evidence=evidence,
                     relationship_type=rel_type
                 )
+                content.append((source, target, weight, rel_type,
+                                tuple(evidence) if isinstance(evidence, list) else evidence))
+        
+        # Lets consumers holding a reference to self.graph drop cached views. The
+        # revision only moves when the content differs, so identical rebuilds (every
+        # chat request rebuilds from the client's copy of the graph) keep them.
+        try:
+            content_hash = hash(tuple(content))
+        except TypeError:  # unhashable attribute values in a client-supplied graph
+            content_hash = None
+        if content_hash is None or content_hash != self._content_hash:
+            self._revision += 1
+            self._content_hash = content_hash
+        self.graph.graph["revision"] = self._revision
         
         # Convert to output format
-        nodes = self._build_nodes()
-        edges = self._build_edges()
+        nodes = self._build_nodes(self.graph)
+        edges = self._build_edges(self.graph)
         
         return GraphData(
             nodes=nodes,
@@ -62,13 +141,13 @@ class GraphBuilder:
             }
         )
     
-    def _build_nodes(self) -> List[Node]:
-        """Convert networkx nodes to Node schema"""
+    def _build_nodes(self, graph: nx.Graph, order: Optional[List[str]] = None) -> List[Node]:
+        """Convert networkx nodes to Node schema, in the given node order if any"""
         nodes = []
+        node_items = graph.nodes(data=True) if order is None else ((node, graph.nodes[node]) for node in order)
         
-        for node_id in self.graph.nodes():
-            node_data = self.graph.nodes[node_id]
-            degree = self.graph.degree(node_id)
+        for node_id, node_data in node_items:
+            degree = graph.degree(node_id)
             
             nodes.append(Node(
                 id=node_id,
@@ -82,12 +161,27 @@ class GraphBuilder:
         
         return nodes
     
-    def _build_edges(self) -> List[Edge]:
-        """Convert networkx edges to Edge schema"""
+    def _build_edges(self, graph: nx.Graph, order: Optional[List[str]] = None) -> List[Edge]:
+        """Convert networkx edges to Edge schema, visiting endpoints in the given node order if any"""
         edges = []
+        if order is None:
+            edge_items = graph.edges(data=True)
+        else:
+            # Subgraph views may iterate neighbors through a set, so each node's
+            # edges are sorted by the given order, and every edge is emitted
+            # once, from its earlier endpoint
+            rank = {node: i for i, node in enumerate(order)}
+            adj = graph.adj
+            edge_items = (
+                (source, target, adj[source][target])
+                for source in order
+                for target in sorted(
+                    (nbr for nbr in adj[source] if rank.get(nbr, -1) >= rank[source]),
+                    key=rank.__getitem__
+                )
+            )
         
-        for source, target in self.graph.edges():
-            edge_data = self.graph.edges[source, target]
+        for source, target, edge_data in edge_items:
             evidence = edge_data.get("evidence", [])
             
             # Create title from first evidence sentence
@@ -154,39 +248,54 @@ class GraphBuilder:
             return [[node] for node in self.graph.nodes()]
         
         try:
-            partition = community_louvain.best_partition(self.graph)
-            
-            # Group nodes by community
-            communities_dict = defaultdict(list)
-            for node, community_id in partition.items():
-                communities_dict[community_id].append(node)
+            if IGRAPH_AVAILABLE and settings.enable_igraph:
+                node_order, cid = self._igraph_communities()
+            else:
+                partition = community_louvain.best_partition(self.graph)
+                node_order = np.array(list(partition.keys()), dtype=object)
+                cid = np.fromiter(partition.values(), dtype=np.int32, count=len(partition))
             
-            return list(communities_dict.values())
+            # Group nodes by community: relabel ids by first appearance so groups
+            # keep their first-seen order, stable sort, then split at boundaries
+            _, first, inverse = np.unique(cid, return_index=True, return_inverse=True)
+            cid = np.argsort(np.argsort(first))[inverse]
+            order = np.argsort(cid, kind="stable")
+            boundaries = np.flatnonzero(np.diff(cid[order])) + 1
+            return [group.tolist() for group in np.split(node_order[order], boundaries)]
         except:
             return [[node] for node in self.graph.nodes()]
     
+    def _igraph_communities(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Weighted Louvain (multilevel) membership from igraph, in graph node order"""
+        node_order = list(self.graph.nodes())
+        node_idx = {node: i for i, node in enumerate(node_order)}
+        edge_pairs = []
+        weights = []
+        for u, v, weight in self.graph.edges(data="weight", default=1.0):
+            edge_pairs.append((node_idx[u], node_idx[v]))
+            weights.append(weight)
+        
+        g = ig.Graph(n=len(node_order), edges=edge_pairs)
+        membership = g.community_multilevel(weights=weights).membership
+        return np.array(node_order, dtype=object), np.asarray(membership, dtype=np.int32)
+    
     def _compute_centrality(self) -> Dict[str, float]:
         """Compute betweenness centrality for all nodes"""
         if len(self.graph.nodes()) < 2:
             return {node: 0.0 for node in self.graph.nodes()}
         
         try:
-            centrality = nx.betweenness_centrality(self.graph)
-            # Return top 20 by centrality
-            sorted_centrality = sorted(centrality.items(), key=lambda x: x[1], reverse=True)
-            return dict(sorted_centrality[:20])
+            centrality = _betweenness_centrality(self.graph)
+            # Return top 20 by centrality (partial heap select, same order as a full sort)
+            return dict(heapq.nlargest(20, centrality.items(), key=itemgetter(1)))
         except:
             return {}
     
     def _count_entity_types(self) -> Dict[str, int]:
-        """Count entities by type"""
-        counts = defaultdict(int)
-        
-        for node_id in self.graph.nodes():
-            entity_type = self.graph.nodes[node_id].get("entity_type", "UNKNOWN")
-            counts[entity_type] += 1
-        
-        return dict(counts)
+        """Count entities by type, in the order each type is first seen"""
+        return dict(Counter(
+            entity_type for _, entity_type in self.graph.nodes(data="entity_type", default="UNKNOWN")
+        ))
     
     def filter_graph(
         self,
@@ -195,42 +304,29 @@ class GraphBuilder:
         top_n: int = None
     ) -> GraphData:
         """Filter graph based on criteria"""
-        filtered_graph = self.graph.copy()
-        
-        # Filter by degree
-        nodes_to_remove = [
-            node for node in filtered_graph.nodes()
-            if filtered_graph.degree(node) < min_degree
+        # Degree and entity type predicates in a single pass over the nodes
+        type_set = set(entity_types) if entity_types else None
+        node_data = self.graph.nodes
+        keep = [
+            node for node, degree in self.graph.degree()
+            if degree >= min_degree
+            and (type_set is None or node_data[node].get("entity_type") in type_set)
         ]
-        filtered_graph.remove_nodes_from(nodes_to_remove)
-        
-        # Filter by entity type
-        if entity_types:
-            nodes_to_remove = [
-                node for node in filtered_graph.nodes()
-                if filtered_graph.nodes[node].get("entity_type") not in entity_types
-            ]
-            filtered_graph.remove_nodes_from(nodes_to_remove)
+        filtered_graph = self.graph.subgraph(keep)
         
-        # Keep only top N nodes by degree
+        # Keep only top N nodes by degree within the filtered graph
         if top_n:
-            degrees = dict(filtered_graph.degree())
-            sorted_nodes = sorted(degrees.items(), key=lambda x: x[1], reverse=True)
-            nodes_to_keep = [node for node, _ in sorted_nodes[:top_n]]
-            nodes_to_remove = [node for node in filtered_graph.nodes() if node not in nodes_to_keep]
-            filtered_graph.remove_nodes_from(nodes_to_remove)
+            top_nodes = set(heapq.nlargest(top_n, keep, key=filtered_graph.degree))
+            keep = [node for node in keep if node in top_nodes]
+            filtered_graph = self.graph.subgraph(keep)
         
-        # Rebuild graph data
-        temp_graph = self.graph
-        self.graph = filtered_graph
-        result = GraphData(
-            nodes=self._build_nodes(),
-            edges=self._build_edges(),
+        # Subgraph views are read-only; no copy is needed to serialize them.
+        # Their iteration order follows a set, so serialize in `keep` order.
+        return GraphData(
+            nodes=self._build_nodes(filtered_graph, keep),
+            edges=self._build_edges(filtered_graph, keep),
             metadata={"filtered": True}
         )
-        self.graph = temp_graph
-        
-        return result
     
     def merge_graphs(self, base_entities: Dict[str, Dict], base_relationships: List[Dict],
                      new_entities: Dict[str, Dict], new_relationships: List[Dict]) -> GraphData:
@@ -249,11 +345,19 @@ class GraphBuilder:
             else:
                 merged_entities[key] = entity
         
-        # Merge relationships: aggregate weights, combine evidence
-        rel_map = {}
+        # Merge relationships: aggregate weights, combine evidence.
+        # Endpoints are interned to small ints so each undirected pair packs
+        # into a single int key.
+        node_ids: Dict[str, int] = {}
+        
+        def pair_key(rel: Dict) -> int:
+            a = node_ids.setdefault(rel["source"], len(node_ids))
+            b = node_ids.setdefault(rel["target"], len(node_ids))
+            return (a << 32) | b if a < b else (b << 32) | a
+        
+        rel_map: Dict[int, Dict] = {}
         for rel in base_relationships:
-            key = tuple(sorted([rel["source"], rel["target"]]))
-            rel_map[key] = {
+            rel_map[pair_key(rel)] = {
                 "source": rel["source"],
                 "target": rel["target"],
                 "weight": rel.get("weight", 1.0),
@@ -261,16 +365,28 @@ class GraphBuilder:
                 "relationship_type": rel.get("relationship_type", "CO_OCCURRENCE")
             }
         
+        # Evidence already kept per merged pair, for O(1) dedup
+        evidence_seen: Dict[int, set] = {}
         for rel in new_relationships:
-            key = tuple(sorted([rel["source"], rel["target"]]))
-            if key in rel_map:
+            key = pair_key(rel)
+            merged = rel_map.get(key)
+            if merged is not None:
                 # Aggregate weight and merge evidence
-                rel_map[key]["weight"] += rel.get("weight", 1.0)
-                existing_evidence = rel_map[key]["evidence"]
-                new_evidence = rel.get("evidence", [])
+                merged["weight"] += rel.get("weight", 1.0)
+                seen = evidence_seen.get(key)
+                if seen is None:
+                    evidence = list(dict.fromkeys(merged["evidence"]))[:5]
+                    merged["evidence"] = evidence
+                    seen = evidence_seen[key] = set(evidence)
+                else:
+                    evidence = merged["evidence"]
                 # Combine and deduplicate evidence (keep top 5)
-                combined = list(dict.fromkeys(existing_evidence + new_evidence))
-                rel_map[key]["evidence"] = combined[:5]
+                for sentence in rel.get("evidence", []):
+                    if len(evidence) >= 5:
+                        break
+                    if sentence not in seen:
+                        seen.add(sentence)
+                        evidence.append(sentence)
             else:
                 rel_map[key] = {
                     "source": rel["source"],
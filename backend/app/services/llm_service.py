@@ -1,6 +1,12 @@
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple, Awaitable, Callable
+from collections import OrderedDict
 import asyncio
+import hashlib
 import json
+import weakref
+from functools import partial
+import httpx
+import numpy as np
 from app.config import settings
 
 # Only Anthropic import
@@ -10,6 +16,213 @@ try:
 except ImportError:
     ANTHROPIC_AVAILABLE = False
 
+# Optional persistent store for the response cache
+try:
+    import diskcache
+    DISKCACHE_AVAILABLE = True
+except ImportError:
+    DISKCACHE_AVAILABLE = False
+
+# Optional sentence embeddings for the semantic response cache
+try:
+    from sentence_transformers import SentenceTransformer
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
+
+# Optional faster JSON parser for LLM replies. orjson.JSONDecodeError subclasses
+# json.JSONDecodeError, so the existing except clauses cover both parsers.
+try:
+    import orjson
+    _json_loads = orjson.loads
+    ORJSON_AVAILABLE = True
+except ImportError:
+    _json_loads = json.loads
+    ORJSON_AVAILABLE = False
+
+# Optional request-rate limiter for fan-out calls
+try:
+    from aiolimiter import AsyncLimiter
+    AIOLIMITER_AVAILABLE = True
+except ImportError:
+    AIOLIMITER_AVAILABLE = False
+
+# Sentences packed into one multi-sentence extraction prompt
+_BULK_EXTRACTION_SIZE = 8
+
+# Message Batches API limits and polling schedule
+_BATCH_MAX_REQUESTS = 10000
+_BATCH_POLL_INITIAL = 5.0
+_BATCH_POLL_MAX = 60.0
+
+# Process-wide async clients keyed by API key. LLMService is instantiated in
+# several places; sharing one client keeps its keep-alive connections warm.
+_ASYNC_CLIENTS: Dict[str, "anthropic.AsyncAnthropic"] = {}
+_HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=100, keepalive_expiry=30.0)
+
+
+def _get_async_client(api_key: str) -> "anthropic.AsyncAnthropic":
+    """Return the shared AsyncAnthropic client for api_key, creating it on first use"""
+    client = _ASYNC_CLIENTS.get(api_key)
+    if client is None:
+        client = anthropic.AsyncAnthropic(
+            api_key=api_key,
+            http_client=anthropic.DefaultAsyncHttpxClient(limits=_HTTP_LIMITS)
+        )
+        _ASYNC_CLIENTS[api_key] = client
+    return client
+
+
+_RATE_LIMITER: Optional["AsyncLimiter"] = None
+
+
+def _get_rate_limiter() -> Optional["AsyncLimiter"]:
+    """Process-wide requests-per-minute limiter, or None when disabled or unavailable"""
+    global _RATE_LIMITER
+    if _RATE_LIMITER is None and AIOLIMITER_AVAILABLE and settings.llm_requests_per_minute > 0:
+        _RATE_LIMITER = AsyncLimiter(settings.llm_requests_per_minute, 60)
+    return _RATE_LIMITER
+
+
+class _ResponseCache:
+    """
+    Two-tier prompt -> response text cache, namespaced per call type.
+    Tier 1 is an exact match on a blake2b digest of the prompt (kept in
+    diskcache when a cache directory is configured, otherwise an in-memory LRU).
+    Tier 2, when enabled, serves calls that pass a semantic (payload, guard)
+    pair: it returns the response of the earlier call whose payload embedding
+    is most similar, if the similarity clears the threshold and the guard
+    (e.g. the entities the prompt is about) is identical.
+    """
+    
+    SEMANTIC_MODEL = "all-MiniLM-L6-v2"
+    # diskcache bounds its size in bytes; budget this much per cached response
+    DISK_ENTRY_BYTES = 4096
+    
+    def __init__(self, max_entries: int, directory: str = "", semantic: bool = False, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._disk = diskcache.Cache(
+            directory,
+            size_limit=max_entries * self.DISK_ENTRY_BYTES,
+            eviction_policy="least-recently-used"
+        ) if directory and DISKCACHE_AVAILABLE else None
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._semantic = semantic and SENTENCE_TRANSFORMERS_AVAILABLE
+        self._encoder = None
+        # Per namespace: unit-norm payload embeddings, their guard digests and
+        # the exact keys they map to
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._vector_guards: Dict[str, np.ndarray] = {}
+        self._vector_keys: Dict[str, List[str]] = {}
+    
+    @staticmethod
+    def _key(namespace: str, prompt: str) -> str:
+        return f"{namespace}:{hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest()}"
+    
+    @staticmethod
+    def _guard_id(guard: Tuple) -> int:
+        digest = hashlib.blake2b(json.dumps(guard).encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "little", signed=True)
+    
+    def _get_exact(self, key: str) -> Optional[str]:
+        if self._disk is not None:
+            return self._disk.get(key)
+        text = self._memory.get(key)
+        if text is not None:
+            self._memory.move_to_end(key)
+        return text
+    
+    def _set_exact(self, key: str, text: str):
+        if self._disk is not None:
+            self._disk.set(key, text)
+            return
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+    
+    async def _embed(self, payload: str) -> np.ndarray:
+        if self._encoder is None:
+            self._encoder = await asyncio.to_thread(SentenceTransformer, self.SEMANTIC_MODEL)
+        vector = await asyncio.to_thread(self._encoder.encode, payload, normalize_embeddings=True)
+        return np.asarray(vector, dtype=np.float32)
+    
+    async def get(
+        self,
+        namespace: str,
+        prompt: str,
+        semantic: Optional[Tuple[str, Tuple]] = None
+    ) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Cached response for prompt (None on a miss in both tiers), plus the
+        payload embedding computed on a semantic miss, to pass back to set()
+        """
+        text = self._get_exact(self._key(namespace, prompt))
+        if text is not None or not self._semantic or semantic is None:
+            return text, None
+        
+        payload, guard = semantic
+        vector = await self._embed(payload)
+        vectors = self._vectors.get(namespace)
+        if vectors is None:
+            return None, vector
+        scores = vectors @ vector
+        scores[self._vector_guards[namespace] != self._guard_id(guard)] = -1.0
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None, vector
+        return self._get_exact(self._vector_keys[namespace][best]), vector
+    
+    async def set(
+        self,
+        namespace: str,
+        prompt: str,
+        text: str,
+        semantic: Optional[Tuple[str, Tuple]] = None,
+        vector: Optional[np.ndarray] = None
+    ):
+        """Store the response for prompt in the exact tier, and in the semantic tier when given a payload"""
+        key = self._key(namespace, prompt)
+        self._set_exact(key, text)
+        if not self._semantic or semantic is None:
+            return
+        
+        payload, guard = semantic
+        if vector is None:
+            vector = await self._embed(payload)
+        vectors = self._vectors.get(namespace)
+        guards = self._vector_guards.get(namespace)
+        keys = self._vector_keys.setdefault(namespace, [])
+        guard_id = np.array([self._guard_id(guard)], dtype=np.int64)
+        if vectors is None:
+            vectors, guards = vector[None, :], guard_id
+        else:
+            vectors, guards = np.vstack((vectors, vector)), np.concatenate((guards, guard_id))
+        keys.append(key)
+        if len(keys) > self.max_entries:
+            # Drop the oldest rows
+            vectors = vectors[-self.max_entries:]
+            guards = guards[-self.max_entries:]
+            del keys[:-self.max_entries]
+        self._vectors[namespace] = vectors
+        self._vector_guards[namespace] = guards
+
+
+_RESPONSE_CACHE: Optional[_ResponseCache] = None
+
+
+def _get_response_cache() -> Optional[_ResponseCache]:
+    """Process-wide LLM response cache, or None when disabled"""
+    global _RESPONSE_CACHE
+    if _RESPONSE_CACHE is None and settings.llm_cache_size > 0:
+        _RESPONSE_CACHE = _ResponseCache(
+            settings.llm_cache_size,
+            directory=settings.llm_cache_dir,
+            semantic=settings.llm_semantic_cache
+        )
+    return _RESPONSE_CACHE
+
 
 class LLMService:
     """
@@ -22,10 +235,16 @@ class LLMService:
         # Use Anthropic API directly
         anthropic_key = "sk-ant-REDACTED"
         self.anthropic_client = None
+        self.concurrency = settings.llm_max_concurrency
+        # Chat stream slots, one semaphore per event loop (asyncio primitives
+        # are bound to the loop they are first used in)
+        self._stream_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
         
         if ANTHROPIC_AVAILABLE:
             try:
-                self.anthropic_client = anthropic.Anthropic(api_key=anthropic_key)
+                self.anthropic_client = _get_async_client(anthropic_key)
                 self.enabled = True
                 print("✅ LLM service enabled with direct Anthropic API")
             except Exception as e:
@@ -35,6 +254,14 @@ class LLMService:
             print("⚠️  Anthropic library not available")
             self.enabled = False
     
+    def stream_semaphore(self) -> asyncio.Semaphore:
+        """Semaphore bounding this service's concurrent chat streams in the running event loop"""
+        loop = asyncio.get_running_loop()
+        sem = self._stream_semaphores.get(loop)
+        if sem is None:
+            sem = self._stream_semaphores[loop] = asyncio.Semaphore(max(1, self.concurrency))
+        return sem
+    
     async def extract_relationships_from_sentence(
         self,
         sentence: str,
@@ -51,13 +278,98 @@ class LLMService:
         
         try:
             if self.anthropic_client:
-                return await self._extract_with_anthropic(prompt)
+                return await self._extract_with_anthropic(prompt, (sentence, tuple(sorted(set(entities)))))
         except Exception as e:
             print(f"LLM extraction failed: {e}")
             return []
         
         return []
     
+    async def extract_relationships_bulk(
+        self,
+        sentences_entities: List[Tuple[str, List[str]]],
+        k: int = _BULK_EXTRACTION_SIZE
+    ) -> List[List[Dict[str, any]]]:
+        """
+        Extract relationships for many sentences, packing k sentences into each
+        request so the fixed instructions are paid once per chunk.
+        Returns one relationship list per (sentence, entities) pair, in input order.
+        """
+        if not self.enabled or not self.anthropic_client or not sentences_entities:
+            return [[] for _ in sentences_entities]
+        
+        k = max(1, k)
+        chunks = [sentences_entities[i:i + k] for i in range(0, len(sentences_entities), k)]
+        per_chunk = await self._gather_limited(
+            [partial(self._extract_bulk_chunk, chunk) for chunk in chunks],
+            self.concurrency
+        )
+        return [relationships for chunk_results in per_chunk for relationships in chunk_results]
+    
+    async def _extract_bulk_chunk(
+        self,
+        chunk: List[Tuple[str, List[str]]]
+    ) -> List[List[Dict[str, any]]]:
+        """Run one multi-sentence extraction prompt and split the reply back per sentence"""
+        try:
+            content = await self._cached_completion(
+                "extract_bulk",
+                self._build_bulk_extraction_prompt(chunk),
+                model="claude-3-haiku-20240307",
+                max_tokens=min(4096, 400 * len(chunk))
+            )
+            return self._parse_bulk_relationships(content, len(chunk))
+        except Exception as e:
+            print(f"Anthropic bulk extraction failed: {e}")
+            return [[] for _ in chunk]
+    
+    async def extract_relationships_many(
+        self,
+        sentences_entities: List[Tuple[str, List[str]]],
+        max_concurrency: int = 50
+    ) -> List[List[Dict[str, any]]]:
+        """
+        Extract relationships for many sentences concurrently.
+        Returns one relationship list per (sentence, entities) pair, in input order.
+        """
+        return await self._gather_limited(
+            [partial(self.extract_relationships_from_sentence, sentence, entities)
+             for sentence, entities in sentences_entities],
+            max_concurrency
+        )
+    
+    async def classify_relationships_many(
+        self,
+        triples: List[Tuple[str, str, str]],
+        max_concurrency: int = 50
+    ) -> List[Optional[str]]:
+        """
+        Classify many (source, target, evidence) triples concurrently.
+        Returns one relationship type (or None) per triple, in input order.
+        """
+        return await self._gather_limited(
+            [partial(self.classify_relationship, *triple) for triple in triples],
+            max_concurrency
+        )
+    
+    async def _gather_limited(
+        self,
+        calls: List[Callable[[], Awaitable[Any]]],
+        max_concurrency: int
+    ) -> List[Any]:
+        """Run the calls concurrently, at most max_concurrency in flight and within the rate limit"""
+        sem = asyncio.Semaphore(max(1, max_concurrency))
+        limiter = _get_rate_limiter()
+        
+        async def run(call):
+            async with sem:
+                if limiter is not None:
+                    async with limiter:
+                        return await call()
+                return await call()
+        
+        return await asyncio.gather(*(run(call) for call in calls))
+    
     def _build_extraction_prompt(self, sentence: str, entities: List[str]) -> str:
         """Build prompt for relationship extraction"""
         entities_str = ", ".join(entities)
@@ -82,42 +394,194 @@ If no clear relationships exist, return an empty array.
         return prompt
     
     
-    async def _extract_with_anthropic(self, prompt: str) -> List[Dict[str, any]]:
+    def _build_bulk_extraction_prompt(self, chunk: List[Tuple[str, List[str]]]) -> str:
+        """Build one prompt covering several numbered (sentence, entities) items"""
+        items = "\n\n".join(
+            f"Item {i}:\nSentence: {sentence}\nEntities: {', '.join(entities)}"
+            for i, (sentence, entities) in enumerate(chunk, 1)
+        )
+        
+        prompt = f"""Given the following numbered biomedical sentences and their entities, extract relationships between the entities of each sentence.
+
+{items}
+
+For each relationship found, provide:
+1. Source entity
+2. Target entity
+3. Relationship type (e.g., INHIBITS, ACTIVATES, TREATS, CAUSES, ASSOCIATES_WITH)
+4. Confidence (0.0 to 1.0)
+
+Return as JSON array with one object per item:
+[{{"id": 1, "relationships": [{{"source": "...", "target": "...", "type": "...", "confidence": 0.9}}]}}]
+
+Use an empty relationships array for items with no clear relationships.
+"""
+        return prompt
+    
+    async def _cached_completion(
+        self,
+        namespace: str,
+        prompt: str,
+        semantic: Optional[Tuple[str, Tuple]] = None,
+        **params
+    ) -> str:
+        """
+        Single-prompt completion through the shared response cache.
+        semantic is the (payload, guard) pair that near-duplicate lookups compare:
+        the variable part of the prompt and the values a reused answer must share
+        exactly. Without it only exact prompt matches are reused.
+        Only successful responses are cached; API errors propagate to the caller.
+        """
+        cache = _get_response_cache()
+        vector = None
+        if cache is not None:
+            cached, vector = await cache.get(namespace, prompt, semantic)
+            if cached is not None:
+                return cached
+        
+        response = await self.anthropic_client.messages.create(
+            messages=[{"role": "user", "content": prompt}],
+            **params
+        )
+        text = response.content[0].text
+        if cache is not None:
+            await cache.set(namespace, prompt, text, semantic, vector)
+        return text
+    
+    async def _extract_with_anthropic(
+        self,
+        prompt: str,
+        semantic: Optional[Tuple[str, Tuple]] = None
+    ) -> List[Dict[str, any]]:
         """Extract using direct Anthropic API"""
         try:
-            messages = [{"role": "user", "content": prompt}]
-            
-            response = await asyncio.to_thread(
-                self.anthropic_client.messages.create,
+            content = await self._cached_completion(
+                "extract",
+                prompt,
+                semantic,
                 model="claude-3-haiku-20240307",
-                max_tokens=500,
-                messages=messages
+                max_tokens=500
             )
-            
-            content = response.content[0].text
-            
-            # Parse JSON response
-            try:
-                relationships = json.loads(content)
-                if isinstance(relationships, list):
-                    return relationships
-                elif isinstance(relationships, dict):
-                    # Handle case where LLM returns a single relationship as dict
-                    if "relationships" in relationships:
-                        return relationships["relationships"] if isinstance(relationships["relationships"], list) else [relationships["relationships"]]
-                    elif "source" in relationships and "target" in relationships:
-                        # Single relationship returned as dict, wrap in list
-                        return [relationships]
-                    else:
-                        return []
+            return self._parse_relationships(content)
+                
+        except Exception as e:
+            print(f"Anthropic extraction failed: {e}")
+            return []
+    
+    def _parse_relationships(self, content: str) -> List[Dict[str, any]]:
+        """Parse the JSON relationship list returned for an extraction prompt"""
+        try:
+            relationships = _json_loads(content)
+            if isinstance(relationships, list):
+                return relationships
+            elif isinstance(relationships, dict):
+                # Handle case where LLM returns a single relationship as dict
+                if "relationships" in relationships:
+                    return relationships["relationships"] if isinstance(relationships["relationships"], list) else [relationships["relationships"]]
+                elif "source" in relationships and "target" in relationships:
+                    # Single relationship returned as dict, wrap in list
+                    return [relationships]
                 else:
                     return []
-            except json.JSONDecodeError:
+            else:
                 return []
+        except json.JSONDecodeError:
+            return []
+    
+    def _parse_bulk_relationships(self, content: str, n_items: int) -> List[List[Dict[str, any]]]:
+        """Demultiplex a multi-sentence extraction reply into one relationship list per item"""
+        results = [[] for _ in range(n_items)]
+        try:
+            items = _json_loads(content)
+        except json.JSONDecodeError:
+            return results
+        if isinstance(items, dict):
+            items = items.get("items", items.get("results", [items]))
+        if not isinstance(items, list):
+            return results
+        
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            try:
+                idx = int(item.get("id")) - 1
+            except (TypeError, ValueError):
+                continue
+            relationships = item.get("relationships")
+            if 0 <= idx < n_items and relationships:
+                results[idx] = relationships if isinstance(relationships, list) else [relationships]
+        return results
+    
+    async def extract_relationships_batch(
+        self,
+        sentences_entities: List[Tuple[str, List[str]]]
+    ) -> List[List[Dict[str, any]]]:
+        """
+        Extract relationships for many sentences through the Message Batches API.
+        All prompts are submitted at once (at half the per-token cost) and processed
+        server-side; results can take minutes, so this is meant for bulk document
+        processing rather than interactive requests.
+        Returns one relationship list per (sentence, entities) pair, in input order.
+        """
+        results: List[List[Dict[str, any]]] = [[] for _ in sentences_entities]
+        if not self.enabled or not self.anthropic_client or not sentences_entities:
+            return results
+        
+        # Answer what we can from the response cache; batch only the misses
+        cache = _get_response_cache()
+        prompts: Dict[int, str] = {}
+        # Semantic cache payloads (and embeddings computed on a miss), as in extract_relationships_from_sentence
+        semantics: Dict[int, Tuple[Tuple[str, Tuple], Any]] = {}
+        for i, (sentence, entities) in enumerate(sentences_entities):
+            prompt = self._build_extraction_prompt(sentence, entities)
+            semantic = (sentence, tuple(sorted(set(entities))))
+            cached, vector = await cache.get("extract", prompt, semantic) if cache is not None else (None, None)
+            if cached is not None:
+                results[i] = self._parse_relationships(cached)
+            else:
+                prompts[i] = prompt
+                semantics[i] = (semantic, vector)
+        if not prompts:
+            return results
+        
+        requests = [
+            {
+                "custom_id": str(i),
+                "params": {
+                    "model": "claude-3-haiku-20240307",
+                    "max_tokens": 500,
+                    "messages": [{"role": "user", "content": prompt}]
+                }
+            }
+            for i, prompt in prompts.items()
+        ]
+        
+        batches = self.anthropic_client.beta.messages.batches
+        try:
+            submitted = [
+                await batches.create(requests=requests[start:start + _BATCH_MAX_REQUESTS])
+                for start in range(0, len(requests), _BATCH_MAX_REQUESTS)
+            ]
+            
+            for batch in submitted:
+                # Poll with exponential backoff until the batch has ended
+                delay = _BATCH_POLL_INITIAL
+                while batch.processing_status != "ended":
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, _BATCH_POLL_MAX)
+                    batch = await batches.retrieve(batch.id)
                 
+                async for entry in await batches.results(batch.id):
+                    if entry.result.type == "succeeded":
+                        i = int(entry.custom_id)
+                        text = entry.result.message.content[0].text
+                        results[i] = self._parse_relationships(text)
+                        if cache is not None:
+                            await cache.set("extract", prompts[i], text, *semantics[i])
         except Exception as e:
-            print(f"Anthropic extraction failed: {e}")
-            return []
+            print(f"Batch LLM extraction failed: {e}")
+        
+        return results
     
     async def classify_relationship(
         self,
@@ -153,17 +617,17 @@ Return only the relationship type, nothing else.
 """
         
         try:
-            messages = [{"role": "user", "content": prompt}]
-            
             # Use direct Anthropic API
             if self.anthropic_client:
-                response = await asyncio.to_thread(
-                    self.anthropic_client.messages.create,
+                # Direction matters: (A, B) and (B, A) never share an answer
+                text = await self._cached_completion(
+                    "classify",
+                    prompt,
+                    (evidence, (source, target)),
                     model="claude-3-haiku-20240307",
-                    max_tokens=20,
-                    messages=messages
+                    max_tokens=20
                 )
-                return response.content[0].text.strip()
+                return text.strip()
         except Exception as e:
             print(f"LLM classification failed: {e}")
             return None
@@ -184,24 +648,21 @@ Return only the relationship type, nothing else.
             return []
         
         try:
-            messages = [{"role": "user", "content": prompt}]
-            
             # Use direct Anthropic API
             if self.anthropic_client:
-                response = await asyncio.to_thread(
-                    self.anthropic_client.messages.create,
+                response_text = await self._cached_completion(
+                    "insights",
+                    prompt,
                     model="claude-3-5-sonnet-20241022",
                     max_tokens=2000,
-                    temperature=0.3,
-                    messages=messages
+                    temperature=0.3
                 )
-                response_text = response.content[0].text
             else:
                 return []
             
             # Parse JSON response
             try:
-                insights = json.loads(response_text)
+                insights = _json_loads(response_text)
                 if isinstance(insights, list):
                     return insights
                 elif isinstance(insights, dict):
@@ -253,8 +714,7 @@ Return only the relationship type, nothing else.
         
         try:
             if self.anthropic_client:
-                response = await asyncio.to_thread(
-                    self.anthropic_client.messages.create,
+                response = await self.anthropic_client.messages.create(
                     model="claude-3-5-sonnet-20241022",
                     max_tokens=1000,
                     temperature=0.7,
@@ -266,3 +726,15 @@ Return only the relationship type, nothing else.
             return ""
         
         return ""
+    
+    async def aclose(self):
+        """Close the shared Anthropic client and its connection pool (call on shutdown)"""
+        client = self.anthropic_client
+        self.anthropic_client = None
+        self.enabled = False
+        if client is None:
+            return
+        for key, shared in list(_ASYNC_CLIENTS.items()):
+            if shared is client:
+                del _ASYNC_CLIENTS[key]
+        await client.close()
@@ -1,7 +1,29 @@
+import logging
 import spacy
+import sys
 from typing import List, Dict, Set, Tuple
 from collections import defaultdict
+from functools import lru_cache
 import re
+import pandas as pd
+from app.config import settings
+
+# Optional linear-time regex engine for the entity exclusion patterns
+try:
+    import re2
+    RE2_AVAILABLE = True
+except ImportError:
+    RE2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+_HAS_ASCII_LETTER = re.compile(r'[a-zA-Z]')
+
+
+@lru_cache(maxsize=65536)
+def _normalize_entity_text(text: str) -> str:
+    """Collapse whitespace and lowercase; entity names recur heavily across sentences"""
+    return " ".join(text.split()).lower()
 
 
 class NERService:
@@ -9,6 +31,15 @@ class NERService:
     
     def __init__(self, model_name: str = "en_ner_bionlp13cg_md"):
         """Initialize the NER model"""
+        # prefer_gpu must run before the model is loaded; it returns False (CPU) when no GPU is usable
+        self.using_gpu = settings.ner_use_gpu and spacy.prefer_gpu()
+        if settings.ner_use_gpu and not self.using_gpu:
+            print("NER: no usable GPU found, running on CPU")
+        
+        # Larger batches keep the GPU busy; worker processes cannot share one device
+        self._batch_size = max(settings.ner_batch_size, 256) if self.using_gpu else settings.ner_batch_size
+        self._n_process = 1 if self.using_gpu else settings.ner_n_process
+        
         try:
             self.nlp = spacy.load(model_name)
         except OSError:
@@ -17,6 +48,12 @@ class NERService:
                 f"pip install https://s3-us-west-2.amazonaws.com/ai2-s2-scispacy/releases/v0.5.4/en_ner_bionlp13cg_md-0.5.4.tar.gz"
             )
         
+        # Pipeline components NER does not depend on; skipped when batch-parsing sentences
+        self._ner_disable = [
+            name for name in ("tagger", "attribute_ruler", "lemmatizer", "parser")
+            if name in self.nlp.pipe_names
+        ]
+        
         # Entity type mappings
         # Expand mapping to cover BioNLP/BCRAFT fine-grained labels
         self.entity_type_map = {
@@ -49,6 +86,9 @@ class NERService:
             "REGULATOR": "ENTITY",
         }
         
+        # Labels accepted by the filter, interned for the per-entity membership test
+        self._accepted_labels = frozenset(sys.intern(label) for label in self.entity_type_map)
+        
         # Minimum entity occurrence threshold - require entities to appear multiple times
         self.min_entity_occurrences = 4
         
@@ -74,8 +114,12 @@ class NERService:
             r'^[^a-z0-9]+$',  # Only special chars
         ]
         
+        # All exclusion patterns as one alternation, matched in a single pass
+        exclude_union = "|".join(f"(?:{pattern})" for pattern in self.exclude_patterns)
+        self._exclude_re = (re2 if RE2_AVAILABLE else re).compile(exclude_union)
+        
         # Common academic/non-medical exact words to skip
-        self.skip_words = {
+        self.skip_words = frozenset(sys.intern(word) for word in {
             'citation', 'figure', 'table', 'references', 'et al', 'doi',
             'abstract', 'introduction', 'methods', 'results', 'discussion',
             'conclusion', 'supplementary', 'materials', 'acknowledgments',
@@ -84,100 +128,106 @@ class NERService:
             'copyright', 'license', 'published', 'publisher', 'corresponding',
             'author', 'authors', 'correspondence', 'affiliation', 'affiliations',
             'international journal', 'and', 'or', 'the', 'of', 'in', 'on', 'at',
-        }
+        })
         # Additional skip patterns: initials, lone letters/short tokens
         self.initials_regex = re.compile(r"^(?:[A-Z]\.?){1,3}$")  # e.g., R., A., R.P.
         self.short_token_regex = re.compile(r"^[A-Za-z]{1,2}$")
     
     def _is_valid_biomedical_entity(self, text: str, label: str) -> bool:
         """Determine if an entity is a valid biomedical entity"""
-        text_lower = text.lower().strip()
+        # Cheap checks first so most rejects never reach the regexes
         
         # Length checks
         if len(text) < 3 or len(text) > 80:
             return False
         
+        # ONLY accept mapped biomedical entity types
+        if label not in self._accepted_labels:
+            return False
+        
         # Check skip words
+        text_lower = text.lower().strip()
         if text_lower in self.skip_words:
             return False
         
         # Check exclusion patterns
-        for pattern in self.exclude_patterns:
-            if re.search(pattern, text_lower):
-                return False
+        if self._exclude_re.search(text_lower):
+            return False
         
         # Must have at least one letter
-        if not re.search(r'[a-zA-Z]', text):
+        if not _HAS_ASCII_LETTER.search(text):
             return False
         
         # Skip if it's mostly numbers or special characters
-        alpha_ratio = sum(c.isalpha() for c in text) / len(text)
+        alpha_ratio = sum(map(str.isalpha, text)) / len(text)
         if alpha_ratio < 0.4:
             return False
         
         # Skip initials and very short tokens
-        if self.initials_regex.match(text.strip()) or self.short_token_regex.match(text.strip()):
-            return False
-
-        # ONLY accept mapped biomedical entity types
-        if label not in self.entity_type_map:
+        stripped = text.strip()
+        if self.initials_regex.match(stripped) or self.short_token_regex.match(stripped):
             return False
         
         return True
     
     def extract_entities(self, text: str) -> List[Dict[str, any]]:
         """Extract entities from text"""
-        doc = self.nlp(text)
+        return self.extract_entities_from_doc(self.nlp(text))
+    
+    def extract_entities_from_doc(self, doc) -> List[Dict[str, any]]:
+        """Extract entities from an already parsed spaCy Doc"""
         entities = []
-        filtered_count = {"total": 0, "by_label": defaultdict(int), "by_reason": defaultdict(int)}
         
         for ent in doc.ents:
+            label = ent.label_
             entity_text = ent.text.strip()
-            filtered_count["total"] += 1
-            filtered_count["by_label"][ent.label_] += 1
             
-            # Apply strict biomedical filtering
-            if not self._is_valid_biomedical_entity(entity_text, ent.label_):
-                filtered_count["by_reason"]["filtered_out"] += 1
+            # Apply strict biomedical filtering (only mapped entity types pass)
+            if not self._is_valid_biomedical_entity(entity_text, label):
                 continue
             
-            # Only use mapped entity types
-            entity_type = self.entity_type_map.get(ent.label_)
-            if entity_type:
-                entities.append({
-                    "text": entity_text,
-                    "type": entity_type,
-                    "start": ent.start_char,
-                    "end": ent.end_char,
-                })
-                filtered_count["by_reason"]["accepted"] += 1
+            entities.append({
+                "text": entity_text,
+                "type": self.entity_type_map[label],
+                "start": ent.start_char,
+                "end": ent.end_char,
+            })
         
         return entities
     
     def extract_entities_from_sentences(self, sentences: List[str]) -> List[Dict[str, any]]:
         """Extract entities from a list of sentences"""
         results = []
+        # Label statistics are only gathered when debug logging is on
+        debug = logger.isEnabledFor(logging.DEBUG)
         all_labels_seen = set()
         sample_entities_by_label = defaultdict(list)
         
-        # Debug: sample first few sentences
-        if len(sentences) > 0:
-            print(f"DEBUG NER: First sentence sample: {sentences[0][:200]}")
+        if debug and sentences:
+            logger.debug("NER: first sentence sample: %s", sentences[0][:200])
         
-        # Process ALL sentences (but collect samples for debugging)
-        for idx, sentence in enumerate(sentences):
-            doc = self.nlp(sentence)
+        # Process ALL sentences in batches
+        docs = self.nlp.pipe(
+            sentences,
+            batch_size=self._batch_size,
+            n_process=self._n_process,
+            disable=self._ner_disable
+        )
+        for idx, (sentence, doc) in enumerate(zip(sentences, docs)):
             
-            # Collect label statistics from raw output
-            for ent in doc.ents:
-                all_labels_seen.add(ent.label_)
-                if len(sample_entities_by_label[ent.label_]) < 3:
-                    sample_entities_by_label[ent.label_].append(ent.text[:50])
+            if debug:
+                # Collect label statistics from raw output
+                for ent in doc.ents:
+                    all_labels_seen.add(ent.label_)
+                    if len(sample_entities_by_label[ent.label_]) < 3:
+                        sample_entities_by_label[ent.label_].append(ent.text[:50])
             
-            entities = self.extract_entities(sentence)
-            if idx < 3 and entities:
-                print(f"DEBUG NER: Sentence {idx} found {len(entities)} entities")
-                print(f"DEBUG NER: Entity examples: {[e['text'] for e in entities[:5]]}")
+            entities = self.extract_entities_from_doc(doc)
+            if debug and idx < 3 and entities:
+                logger.debug(
+                    "NER: sentence %d found %d entities, e.g. %s",
+                    idx, len(entities), [e["text"] for e in entities[:5]]
+                )
             if entities:
                 results.append({
                     "sentence_id": idx,
@@ -185,45 +235,51 @@ class NERService:
                     "entities": entities
                 })
         
-        print(f"\n{'='*60}")
-        print(f"DEBUG NER: Entity Label Analysis")
-        print(f"{'='*60}")
-        print(f"All entity labels found by scispaCy: {sorted(all_labels_seen)}")
-        print(f"\nAccepted labels (mapped): {list(self.entity_type_map.keys())}")
-        print(f"\nSample entities by label:")
-        for label in sorted(sample_entities_by_label.keys()):
-            is_accepted = label in self.entity_type_map
-            status = "✓ ACCEPTED" if is_accepted else "✗ REJECTED"
-            print(f"  {label:20} {status:12} - {sample_entities_by_label[label]}")
-        print(f"\nProcessed {len(sentences)} sentences, found entities in {len(results)} sentences")
-        print(f"{'='*60}\n")
+        if debug:
+            logger.debug("NER: entity labels found by scispaCy: %s", sorted(all_labels_seen))
+            logger.debug("NER: accepted labels (mapped): %s", list(self.entity_type_map.keys()))
+            for label in sorted(sample_entities_by_label.keys()):
+                status = "ACCEPTED" if label in self._accepted_labels else "REJECTED"
+                logger.debug("NER:   %-20s %-8s - %s", label, status, sample_entities_by_label[label])
+            logger.debug(
+                "NER: processed %d sentences, found entities in %d sentences",
+                len(sentences), len(results)
+            )
         return results
     
+    def _entities_df(self, sentence_entities: List[Dict[str, any]]) -> pd.DataFrame:
+        """One row per entity mention: sentence position, text, type and normalized name"""
+        records = [
+            (sid, entity["text"], entity["type"])
+            for sid, sent_data in enumerate(sentence_entities)
+            for entity in sent_data["entities"]
+        ]
+        df = pd.DataFrame.from_records(records, columns=["sid", "text", "type"])
+        df["n"] = df["text"].map(self._normalize_entity)
+        return df
+    
+    def _sentence_counts(self, df: pd.DataFrame) -> pd.Series:
+        """Number of sentences each normalized entity appears in"""
+        return df.drop_duplicates(["sid", "n"]).groupby("n", sort=False).size()
+    
     def get_entity_counts(self, sentence_entities: List[Dict[str, any]]) -> Dict[str, int]:
         """Count entity occurrences across all sentences"""
-        entity_counts = defaultdict(int)
-        
-        for sent_data in sentence_entities:
-            seen_in_sentence = set()
-            for entity in sent_data["entities"]:
-                entity_name = self._normalize_entity(entity["text"])
-                seen_in_sentence.add(entity_name)
-            
-            for entity_name in seen_in_sentence:
-                entity_counts[entity_name] += 1
-        
-        return dict(entity_counts)
+        return self._sentence_counts(self._entities_df(sentence_entities)).to_dict()
     
     def filter_entities(self, sentence_entities: List[Dict[str, any]]) -> List[Dict[str, any]]:
         """Filter out low-frequency entities"""
-        entity_counts = self.get_entity_counts(sentence_entities)
+        df = self._entities_df(sentence_entities)
+        keep = (df["n"].map(self._sentence_counts(df)) >= self.min_entity_occurrences).tolist()
         
         filtered_results = []
+        pos = 0
         for sent_data in sentence_entities:
+            entities = sent_data["entities"]
             filtered_entities = [
-                entity for entity in sent_data["entities"]
-                if entity_counts.get(self._normalize_entity(entity["text"]), 0) >= self.min_entity_occurrences
+                entity for entity, kept in zip(entities, keep[pos:pos + len(entities)])
+                if kept
             ]
+            pos += len(entities)
             
             if filtered_entities:
                 filtered_results.append({
@@ -236,27 +292,16 @@ class NERService:
     
     def _normalize_entity(self, text: str) -> str:
         """Normalize entity text for comparison"""
-        # Remove extra whitespace, lowercase, remove special chars
-        text = re.sub(r'\s+', ' ', text.strip())
-        return text.lower()
+        return _normalize_entity_text(text)
     
     def get_unique_entities(self, sentence_entities: List[Dict[str, any]]) -> Dict[str, Dict[str, any]]:
         """Get unique entities with their types and occurrence counts"""
-        entities = {}
-        
-        for sent_data in sentence_entities:
-            for entity in sent_data["entities"]:
-                entity_name = entity["text"]
-                normalized = self._normalize_entity(entity_name)
-                
-                if normalized not in entities:
-                    entities[normalized] = {
-                        "original_name": entity_name,
-                        "type": entity["type"],
-                        "count": 0
-                    }
-                
-                entities[normalized]["count"] += 1
-        
-        return entities
-
+        grouped = self._entities_df(sentence_entities).groupby("n", sort=False).agg(
+            original_name=("text", "first"),
+            type=("type", "first"),
+            count=("text", "size")
+        )
+        return {
+            normalized: {"original_name": original_name, "type": entity_type, "count": int(count)}
+            for normalized, original_name, entity_type, count in grouped.itertuples()
+        }
@@ -1,7 +1,49 @@
 import fitz  # PyMuPDF
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
 import re
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from app.config import settings
+
+# Optional native sentence splitter
+try:
+    import blingfire
+    BLINGFIRE_AVAILABLE = True
+except ImportError:
+    BLINGFIRE_AVAILABLE = False
+
+_MISSING_SPACE = re.compile(r'([a-z])\.([A-Z])')
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+# Long-lived worker pool for parsing several PDFs, created on first use and
+# closed by the API's shutdown hook. Workers are spawned rather than forked:
+# the server process is multi-threaded (HTTP client pools, NER models), and a
+# forked child can inherit locks that another thread was holding.
+_PROCESS_POOL: Optional[ProcessPoolExecutor] = None
+_PROCESS_POOL_LOCK = threading.Lock()
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    """Process-wide PDF parsing pool with max_concurrent_processing workers"""
+    global _PROCESS_POOL
+    with _PROCESS_POOL_LOCK:
+        if _PROCESS_POOL is None:
+            _PROCESS_POOL = ProcessPoolExecutor(
+                max_workers=settings.max_concurrent_processing,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _PROCESS_POOL
+
+
+def shutdown_process_pool():
+    """Stop the PDF parsing workers, if any were started"""
+    global _PROCESS_POOL
+    with _PROCESS_POOL_LOCK:
+        pool, _PROCESS_POOL = _PROCESS_POOL, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
 
 
 class PDFProcessor:
@@ -14,12 +56,8 @@ class PDFProcessor:
     def extract_text(self, pdf_path: str) -> str:
         """Extract all text from a PDF file"""
         try:
-            doc = fitz.open(pdf_path)
-            text = ""
-            for page in doc:
-                text += page.get_text()
-            doc.close()
-            return text
+            with fitz.open(pdf_path) as doc:
+                return "".join(page.get_text("text") for page in doc)
         except Exception as e:
             raise Exception(f"Failed to extract text from PDF: {str(e)}")
     
@@ -42,12 +80,14 @@ class PDFProcessor:
     
     def split_into_sentences(self, text: str) -> List[str]:
         """Split text into sentences"""
-        # Clean up text
-        text = re.sub(r'\s+', ' ', text)  # Normalize whitespace
-        text = re.sub(r'([a-z])\.([A-Z])', r'\1. \2', text)  # Fix missing spaces after periods
+        text = _MISSING_SPACE.sub(r'\1. \2', text)  # Fix missing spaces after periods
         
-        # Split into sentences (simple heuristic)
-        sentences = re.split(r'(?<=[.!?])\s+', text)
+        if BLINGFIRE_AVAILABLE:
+            # Native splitter on the raw text; normalize whitespace per sentence
+            sentences = (" ".join(s.split()) for s in blingfire.text_to_sentences(text).split("\n"))
+        else:
+            # Normalize whitespace, then split into sentences (simple heuristic)
+            sentences = _SENTENCE_END.split(" ".join(text.split()))
         
         # Filter sentences
         sentences = [
@@ -57,29 +97,33 @@ class PDFProcessor:
         
         return sentences
     
+    def process_pdf(self, pdf_path: str) -> Dict[str, any]:
+        """Extract text, sentences and metadata from one PDF (error dict on failure)"""
+        try:
+            text = self.extract_text(pdf_path)
+            sentences = self.split_into_sentences(text)
+            metadata = self.extract_metadata(pdf_path)
+            
+            return {
+                "filename": Path(pdf_path).name,
+                "text": text,
+                "sentences": sentences,
+                "metadata": metadata,
+                "sentence_count": len(sentences),
+                "char_count": len(text)
+            }
+        except Exception as e:
+            return {
+                "filename": Path(pdf_path).name,
+                "error": str(e)
+            }
+    
     def process_pdfs(self, pdf_paths: List[str]) -> List[Dict[str, any]]:
-        """Process multiple PDFs and return structured data"""
-        results = []
+        """
+        Process multiple PDFs and return structured data, in input order.
+        Parsing is CPU-bound, so several files are spread over the shared worker pool.
+        """
+        if min(len(pdf_paths), settings.max_concurrent_processing) <= 1:
+            return [self.process_pdf(pdf_path) for pdf_path in pdf_paths]
         
-        for pdf_path in pdf_paths:
-            try:
-                text = self.extract_text(pdf_path)
-                sentences = self.split_into_sentences(text)
-                metadata = self.extract_metadata(pdf_path)
-                
-                results.append({
-                    "filename": Path(pdf_path).name,
-                    "text": text,
-                    "sentences": sentences,
-                    "metadata": metadata,
-                    "sentence_count": len(sentences),
-                    "char_count": len(text)
-                })
-            except Exception as e:
-                results.append({
-                    "filename": Path(pdf_path).name,
-                    "error": str(e)
-                })
-        
-        return results
-
+        return list(_get_process_pool().map(self.process_pdf, pdf_paths))
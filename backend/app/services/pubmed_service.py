@@ -1,6 +1,60 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple, Union, Callable
+import asyncio
+import io
+import time
+import httpx
 import requests
 import xml.etree.ElementTree as ET
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.config import settings
+
+try:
+    import diskcache
+    DISKCACHE_AVAILABLE = True
+except ImportError:
+    DISKCACHE_AVAILABLE = False
+
+
+# NCBI allows 3 requests/second per client without an API key
+_NCBI_REQUESTS_PER_SECOND = 3
+_ASYNC_CLIENT: Optional[httpx.AsyncClient] = None
+_RATE_LOCK = asyncio.Lock()
+_next_request_at = 0.0
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    """Return the shared E-utilities AsyncClient, creating it on first use"""
+    global _ASYNC_CLIENT
+    if _ASYNC_CLIENT is None or _ASYNC_CLIENT.is_closed:
+        _ASYNC_CLIENT = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+        )
+    return _ASYNC_CLIENT
+
+
+_CACHE: Optional["diskcache.Cache"] = None
+
+
+def _get_cache() -> Optional["diskcache.Cache"]:
+    """Shared on-disk cache for E-utilities results, or None when not configured"""
+    global _CACHE
+    if _CACHE is None and settings.pubmed_cache_dir and DISKCACHE_AVAILABLE:
+        _CACHE = diskcache.Cache(settings.pubmed_cache_dir, size_limit=int(1e9))
+    return _CACHE
+
+
+async def _throttle():
+    """Space out E-utilities requests process-wide to stay under NCBI's rate limit"""
+    global _next_request_at
+    async with _RATE_LOCK:
+        now = time.monotonic()
+        if _next_request_at > now:
+            await asyncio.sleep(_next_request_at - now)
+            now = _next_request_at
+        _next_request_at = now + 1.0 / _NCBI_REQUESTS_PER_SECOND
 
 
 class PubMedService:
@@ -12,6 +66,72 @@ class PubMedService:
         self.base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
         # You should set this to a real email for NCBI compliance
         self.email = "empirica@example.com"
+        # Keep-alive session so repeated E-utilities calls reuse connections
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=16,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=[429, 500, 502, 503, 504],
+            ),
+        ))
+    
+    def close(self):
+        """Close pooled HTTP connections"""
+        self.session.close()
+    
+    async def aclose(self):
+        """Close both the sync session and the shared async client (call on shutdown)"""
+        global _ASYNC_CLIENT
+        self.close()
+        client, _ASYNC_CLIENT = _ASYNC_CLIENT, None
+        if client is not None:
+            await client.aclose()
+    
+    def _cached_search(self, query: str, max_results: int) -> Optional[List[str]]:
+        cache = _get_cache()
+        return cache.get(("esearch", query, max_results)) if cache is not None else None
+    
+    def _store_search(self, query: str, max_results: int, pmids: List[str]):
+        cache = _get_cache()
+        if cache is not None and pmids:
+            cache.set(("esearch", query, max_results), pmids, expire=settings.pubmed_cache_ttl_seconds)
+    
+    def _split_cached(self, pmids: List[str]) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+        """Split pmids into already-cached papers (by PMID) and PMIDs that still need fetching"""
+        cache = _get_cache()
+        if cache is None:
+            return {}, list(pmids)
+        found = {}
+        missing = []
+        for pmid in pmids:
+            paper = cache.get(("article", pmid))
+            if paper is None:
+                missing.append(pmid)
+            else:
+                found[pmid] = paper
+        return found, missing
+    
+    def _store_papers(self, papers: List[Dict[str, Any]]):
+        cache = _get_cache()
+        if cache is None:
+            return
+        for paper in papers:
+            cache.set(("article", paper["pmid"]), paper, expire=settings.pubmed_cache_ttl_seconds)
+    
+    def _merge_cached(
+        self,
+        pmids: List[str],
+        cached: Dict[str, Dict[str, Any]],
+        fetched: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Combine cached and freshly fetched papers in the order PMIDs were requested"""
+        if not cached:
+            return fetched
+        by_pmid = {**cached, **{paper["pmid"]: paper for paper in fetched}}
+        return [by_pmid[pmid] for pmid in pmids if pmid in by_pmid]
     
     def search(self, query: str, max_results: int = 10) -> List[str]:
         """
@@ -26,11 +146,17 @@ class PubMedService:
             "email": self.email,
         }
         
+        cached = self._cached_search(query, max_results)
+        if cached is not None:
+            return cached
+        
         try:
-            response = requests.get(url, params=params, timeout=10)
+            response = self.session.get(url, params=params, timeout=10)
             response.raise_for_status()
             data = response.json()
-            return data.get("esearchresult", {}).get("idlist", [])
+            pmids = data.get("esearchresult", {}).get("idlist", [])
+            self._store_search(query, max_results, pmids)
+            return pmids
         except Exception as e:
             print(f"PubMed search error: {e}")
             return []
@@ -42,34 +168,135 @@ class PubMedService:
         if not pmids:
             return []
         
+        cached, missing = self._split_cached(pmids)
+        if not missing:
+            return self._merge_cached(pmids, cached, [])
+        
         url = f"{self.base_url}/efetch.fcgi"
         params = {
             "db": "pubmed",
-            "id": ",".join(pmids),
+            "id": ",".join(missing),
             "retmode": "xml",
             "rettype": "abstract",
             "email": self.email,
         }
         
         try:
-            response = requests.get(url, params=params, timeout=30)
+            response = self.session.get(url, params=params, timeout=30)
             response.raise_for_status()
-            return self._parse_pubmed_xml(response.text)
+            papers = self._parse_pubmed_xml(response.content)
+            self._store_papers(papers)
+            return self._merge_cached(pmids, cached, papers)
         except Exception as e:
             print(f"PubMed fetch error: {e}")
+            return self._merge_cached(pmids, cached, [])
+    
+    async def search_async(self, query: str, max_results: int = 10) -> List[str]:
+        """
+        Search PubMed and return PMIDs without blocking the event loop
+        """
+        params = {
+            "db": "pubmed",
+            "term": query,
+            "retmax": max_results,
+            "retmode": "json",
+            "email": self.email,
+        }
+        
+        cached = self._cached_search(query, max_results)
+        if cached is not None:
+            return cached
+        
+        try:
+            await _throttle()
+            response = await _get_async_client().get(f"{self.base_url}/esearch.fcgi", params=params)
+            response.raise_for_status()
+            data = response.json()
+            pmids = data.get("esearchresult", {}).get("idlist", [])
+            self._store_search(query, max_results, pmids)
+            return pmids
+        except Exception as e:
+            print(f"PubMed search error: {e}")
             return []
     
-    def _parse_pubmed_xml(self, xml_text: str) -> List[Dict[str, Any]]:
-        """Parse PubMed XML response"""
+    async def fetch_abstracts_async(self, pmids: List[str]) -> List[Dict[str, Any]]:
+        """
+        Fetch article details for given PMIDs in a single POST request
+        (POST keeps large id lists out of the URL)
+        """
+        if not pmids:
+            return []
+        
+        cached, missing = self._split_cached(pmids)
+        if not missing:
+            return self._merge_cached(pmids, cached, [])
+        
+        data = {
+            "db": "pubmed",
+            "id": ",".join(missing),
+            "retmode": "xml",
+            "rettype": "abstract",
+            "email": self.email,
+        }
+        
+        try:
+            await _throttle()
+            response = await _get_async_client().post(f"{self.base_url}/efetch.fcgi", data=data)
+            response.raise_for_status()
+            papers = self._parse_pubmed_xml(response.content)
+            self._store_papers(papers)
+            return self._merge_cached(pmids, cached, papers)
+        except Exception as e:
+            print(f"PubMed fetch error: {e}")
+            return self._merge_cached(pmids, cached, [])
+    
+    async def discover_and_fetch_many(
+        self,
+        queries: List[str],
+        max_results: int = 10,
+        on_search_done: Optional[Callable[[int, List[str]], None]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Run several searches concurrently, then fetch every PMID they found
+        with one EFetch call. Returns one list of papers per query, in order.
+        on_search_done(query index, pmids) is called as each search finishes.
+        """
+        async def search(i: int, query: str) -> List[str]:
+            pmids = await self.search_async(query, max_results)
+            if on_search_done:
+                on_search_done(i, pmids)
+            return pmids
+        
+        id_lists = await asyncio.gather(*(search(i, q) for i, q in enumerate(queries)))
+        
+        all_pmids = list(dict.fromkeys(pmid for ids in id_lists for pmid in ids))
+        by_pmid = {paper["pmid"]: paper for paper in await self.fetch_abstracts_async(all_pmids)}
+        
+        return [
+            [by_pmid[pmid] for pmid in ids if pmid in by_pmid]
+            for ids in id_lists
+        ]
+    
+    def _parse_pubmed_xml(self, xml_text: Union[str, bytes]) -> List[Dict[str, Any]]:
+        """
+        Parse PubMed XML response incrementally, one PubmedArticle at a time
+        """
         papers = []
+        if isinstance(xml_text, str):
+            xml_text = xml_text.encode("utf-8")
         
         try:
-            root = ET.fromstring(xml_text)
-            
-            for article in root.findall(".//PubmedArticle"):
-                paper = self._extract_article_data(article)
+            root = None
+            for event, elem in ET.iterparse(io.BytesIO(xml_text), events=("start", "end")):
+                if root is None:
+                    root = elem
+                if event != "end" or elem.tag != "PubmedArticle":
+                    continue
+                paper = self._extract_article_data(elem)
                 if paper:
                     papers.append(paper)
+                # Drop finished articles so the tree never holds the whole batch
+                root.clear()
         except Exception as e:
             print(f"XML parsing error: {e}")
         
@@ -79,28 +306,28 @@ class PubMedService:
         """Extract structured data from a PubmedArticle element"""
         try:
             # PMID
-            pmid_elem = article_elem.find(".//PMID")
+            pmid_elem = article_elem.find("MedlineCitation/PMID")
             pmid = pmid_elem.text if pmid_elem is not None else ""
             
             # Article info
-            article_node = article_elem.find(".//Article")
+            article_node = article_elem.find("MedlineCitation/Article")
             if article_node is None:
                 return None
             
             # Title
-            title_elem = article_node.find(".//ArticleTitle")
+            title_elem = article_node.find("ArticleTitle")
             title = title_elem.text if title_elem is not None else "No Title"
             
             # Abstract
             abstract_parts = []
-            for abs_text in article_node.findall(".//AbstractText"):
+            for abs_text in article_node.findall("Abstract/AbstractText"):
                 text = abs_text.text or ""
                 abstract_parts.append(text)
             abstract = " ".join(abstract_parts) if abstract_parts else "No abstract available"
             
             # Authors
             authors = []
-            for author in article_node.findall(".//Author"):
+            for author in article_node.findall("AuthorList/Author"):
                 last = author.find("LastName")
                 first = author.find("ForeName")
                 if last is not None:
@@ -110,26 +337,22 @@ class PubMedService:
                     authors.append(name)
             
             # Journal
-            journal_elem = article_node.find(".//Journal/Title")
+            journal_elem = article_node.find("Journal/Title")
             journal = journal_elem.text if journal_elem is not None else ""
             
             # Year
-            year_elem = article_node.find(".//PubDate/Year")
+            year_elem = article_node.find("Journal/JournalIssue/PubDate/Year")
             year = int(year_elem.text) if year_elem is not None and year_elem.text else None
             
-            # DOI - Try to extract DOI for PDF access
+            # DOI (for PDF access) and PMC ID (for free full-text access)
             doi = None
-            for article_id in article_elem.findall(".//ArticleId"):
-                if article_id.get("IdType") == "doi":
-                    doi = article_id.text
-                    break
-            
-            # PMC ID - For free full-text access
             pmc_id = None
-            for article_id in article_elem.findall(".//ArticleId"):
-                if article_id.get("IdType") == "pmc":
+            for article_id in article_elem.iterfind("PubmedData/ArticleIdList/ArticleId"):
+                id_type = article_id.get("IdType")
+                if id_type == "doi" and doi is None:
+                    doi = article_id.text
+                elif id_type == "pmc" and pmc_id is None:
                     pmc_id = article_id.text
-                    break
             
             return {
                 "pmid": pmid,
@@ -1,10 +1,196 @@
 from typing import List, Dict, Any, Optional, Tuple
+from array import array
+from bisect import bisect_right
+from collections import Counter
 import numpy as np
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+import heapq
 import json
+import os
 import networkx as nx
 from pathlib import Path
 import pickle
+from app.config import settings
+
+# Optional faster JSON codec for the saved index metadata
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Optional sentence embeddings for semantic chunk retrieval
+try:
+    from sentence_transformers import SentenceTransformer
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
+
+# Optional approximate nearest-neighbour index over chunk embeddings
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+# HNSW graph degree for the chunk ANN index
+_HNSW_M = 32
+
+# Binary-quantized search keeps this many Hamming candidates per result for float rescoring
+_BQ_RESCORE_FACTOR = 4
+
+# Graph context summaries remembered per (graph revision, leading entities)
+_SUMMARY_CACHE_SIZE = 1024
+
+# Layout version of the saved full-text postings (.tokens.npz)
+_POSTINGS_FORMAT = 2
+
+# Set-bit count of every byte value, for NumPy Hamming distances over packed bit vectors
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+def _new_slot_array() -> array:
+    return array("i")
+
+
+# Encoders are shared: RAGService is instantiated in several places
+_ENCODERS: Dict[str, "SentenceTransformer"] = {}
+
+
+def _get_encoder(model_name: str) -> "SentenceTransformer":
+    """Return the shared sentence encoder for model_name, loading it on first use"""
+    encoder = _ENCODERS.get(model_name)
+    if encoder is None:
+        encoder = _ENCODERS[model_name] = SentenceTransformer(model_name)
+    return encoder
+
+
+def _write_atomic(filepath: Path, write):
+    """Write via a temp file and rename, so readers (or an open memmap) never see a partial file"""
+    tmp = filepath.with_name(filepath.name + ".tmp")
+    write(str(tmp))
+    os.replace(tmp, filepath)
+
+
+def _save_npy(filepath: str, matrix: np.ndarray):
+    # A file object keeps np.save from appending ".npy" to the temp name
+    with open(filepath, "wb") as f:
+        np.save(f, matrix)
+
+
+def _build_postings(texts: List[str]) -> Tuple[str, List[int], np.ndarray, np.ndarray]:
+    """
+    Inverted index over the whitespace-delimited tokens of the lowercased texts,
+    in CSR form. Returns the vocabulary joined by "\n", the start of each token
+    in it (plus one past the end), and the postings: the rows (text positions)
+    containing token t are rows[offsets[t]:offsets[t + 1]].
+    """
+    tokens = [text.lower().split() for text in texts]
+    lengths = np.fromiter(map(len, tokens), dtype=np.int64, count=len(tokens))
+    vocab: Dict[str, int] = {}
+    token_ids = np.fromiter(
+        (vocab.setdefault(token, len(vocab)) for chunk_tokens in tokens for token in chunk_tokens),
+        dtype=np.int64, count=int(lengths.sum())
+    )
+    n_rows = max(len(texts), 1)
+    # Unique (token, row) pairs, sorted by token then row
+    keys = np.unique(token_ids * n_rows + np.repeat(np.arange(len(texts)), lengths))
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys // n_rows, minlength=len(vocab)), out=offsets[1:])
+    return _join_vocab(list(vocab)) + (offsets, (keys % n_rows).astype(np.int32))
+
+
+def _join_vocab(tokens: List[str]) -> Tuple[str, List[int]]:
+    # Tokens never contain whitespace, so "\n" cannot occur inside one
+    starts = [0]
+    for token in tokens:
+        starts.append(starts[-1] + len(token) + 1)
+    return "\n".join(tokens), starts
+
+
+def _term_rows(postings: Tuple[str, List[int], np.ndarray, np.ndarray], term: str) -> np.ndarray:
+    """
+    Rows whose lowercased text contains term as a substring. A term without
+    whitespace can only occur inside a single token, so the matching tokens are
+    found in the joined vocabulary and their postings merged.
+    """
+    vocab_text, starts, offsets, rows = postings
+    matches = []
+    pos = vocab_text.find(term)
+    while pos != -1:
+        token = bisect_right(starts, pos) - 1
+        matches.append(rows[offsets[token]:offsets[token + 1]])
+        # Continue with the next token; each token counts once
+        pos = vocab_text.find(term, starts[token + 1])
+    if not matches:
+        return np.empty(0, dtype=np.int32)
+    return np.unique(np.concatenate(matches))
+
+
+def _save_postings(filepath: str, postings: Tuple[str, List[int], np.ndarray, np.ndarray], n_rows: int):
+    vocab_text, _, offsets, rows = postings
+    with open(filepath, "wb") as f:
+        np.savez(
+            f,
+            vocab=np.frombuffer(vocab_text.encode("utf-8"), dtype=np.uint8),
+            offsets=offsets,
+            rows=rows,
+            n_rows=np.int64(n_rows),
+            format=np.int64(_POSTINGS_FORMAT)
+        )
+
+
+def _load_postings(filepath: Path, n_rows: int) -> Optional[Tuple[str, List[int], np.ndarray, np.ndarray]]:
+    """Postings saved by _save_postings, or None if they were built for a different chunk count or layout"""
+    with np.load(filepath) as data:
+        if "format" not in data.files or int(data["format"]) != _POSTINGS_FORMAT:
+            return None
+        if int(data["n_rows"]) != n_rows:
+            return None
+        joined = data["vocab"].tobytes().decode("utf-8")
+        offsets = data["offsets"]
+        tokens = joined.split("\n") if len(offsets) > 1 else []
+        return _join_vocab(tokens) + (offsets, data["rows"])
+
+
+def _legacy_index_path(filepath: Path) -> Path:
+    """Where indexes were pickled before the JSON + .npy layout"""
+    return filepath.with_suffix(".pkl")
+
+
+def _read_legacy_index(filepath: Path) -> Optional[Dict[str, Any]]:
+    legacy_path = _legacy_index_path(filepath)
+    if not legacy_path.exists():
+        return None
+    with open(legacy_path, 'rb') as f:
+        return pickle.load(f)
+
+
+def read_index_metadata(filepath: str) -> Optional[Dict[str, Any]]:
+    """
+    Read a saved index's JSON metadata (chunks, entity links, entity metadata),
+    falling back to an older pickled index. Embeddings are not included.
+    """
+    path = Path(filepath)
+    if path.exists():
+        data = path.read_bytes()
+        return orjson.loads(data) if ORJSON_AVAILABLE else json.loads(data)
+    
+    index_data = _read_legacy_index(path)
+    if index_data is not None:
+        index_data.pop("embedding_matrix", None)
+        index_data["entity_to_chunks"] = {
+            entity: list(chunks) for entity, chunks in index_data.get("entity_to_chunks", {}).items()
+        }
+    return index_data
+
+
+def write_index_metadata(filepath: str, index_data: Dict[str, Any]):
+    """Write index metadata as JSON (see read_index_metadata)"""
+    if ORJSON_AVAILABLE:
+        payload = orjson.dumps(index_data)
+    else:
+        payload = json.dumps(index_data).encode("utf-8")
+    _write_atomic(Path(filepath), lambda tmp: Path(tmp).write_bytes(payload))
 
 
 class RAGService:
@@ -21,12 +207,30 @@ class RAGService:
         
         # Storage for document chunks and embeddings
         self.document_chunks: Dict[str, List[Dict[str, Any]]] = {}  # doc_id -> chunks
-        self.chunk_embeddings: Dict[str, np.ndarray] = {}  # chunk_id -> embedding
-        self.entity_to_chunks: Dict[str, List[str]] = defaultdict(list)  # entity -> chunk_ids
+        # Chunk embeddings as one contiguous (N, d) float32 matrix; row i belongs to _emb_chunk_ids[i]
+        self._emb_matrix: Optional[np.ndarray] = None
+        self._emb_chunk_ids: List[str] = []
+        self._ann_index = None  # built lazily from _emb_matrix
+        self._emb_bits: Optional[np.ndarray] = None  # sign bits of _emb_matrix, packed (N, d/8) uint8
+        self._binary_index = None  # Hamming ANN index over _emb_bits
+        # entity -> chunk slots as compact int32 arrays; a slot is an index into _chunk_ids
+        self.entity_to_chunks: Dict[str, array] = defaultdict(_new_slot_array)
+        self._chunk_ids: List[str] = []  # slot -> chunk_id
+        self._chunk_slots: Dict[str, int] = {}  # chunk_id -> slot
+        self.chunk_index: Dict[str, Tuple[str, Dict[str, Any]]] = {}  # chunk_id -> (doc_id, chunk)
+        # Full-text inverted index (see _build_postings); rows follow document_chunks order.
+        # Built when saving or on first use, and read back from _postings_path after load_index.
+        self._text_index: Optional[Tuple[str, List[int], np.ndarray, np.ndarray]] = None
+        self._text_rows = None  # cached _chunk_rows(), reset with _text_index
+        self._postings_path: Optional[Path] = None
         
         # Graph context
         self.graph: Optional[nx.Graph] = None
         self.entity_metadata: Dict[str, Dict] = {}
+        self._summary_cache: "OrderedDict[Tuple, str]" = OrderedDict()
+        # entity -> [(neighbor, edge data)] in adjacency order, for the graph state in _nbr_cache_key
+        self._nbr_cache: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+        self._nbr_cache_key: Optional[Tuple] = None
         
     def index_document(
         self, 
@@ -46,27 +250,242 @@ class RAGService:
                 [{"text": str, "page": int, "chunk_id": str, "entities": List[str]}]
             entities: List of entities found in the document
         """
+        self.bulk_index([(doc_id, text_chunks, entities)])
+    
+    def bulk_index(self, documents: List[Tuple[str, List[Dict[str, Any]], List[Dict[str, Any]]]]):
+        """
+        Index several (doc_id, text_chunks, entities) documents at once, embedding
+        the chunks of all of them in a single batch. If a doc_id repeats, the last
+        occurrence wins, as with successive index_document calls.
+        """
+        last_occurrence = {doc_id: i for i, (doc_id, _, _) in enumerate(documents)}
+        new_chunks = []
+        for i, (doc_id, text_chunks, entities) in enumerate(documents):
+            if last_occurrence[doc_id] == i:
+                self._link_chunks(doc_id, text_chunks)
+                new_chunks.extend(text_chunks)
+        
+        # Embed all chunk texts in one batch for semantic retrieval
+        self._add_embeddings(new_chunks)
+    
+    def _link_chunks(self, doc_id: str, text_chunks: List[Dict[str, Any]]):
+        """Store a document's chunks and link its entities to them (no embeddings)"""
+        # Re-indexing a document replaces its previous chunks
+        previous = self.document_chunks.get(doc_id, [])
+        for chunk in previous:
+            self.chunk_index.pop(chunk.get("chunk_id"), None)
+        if previous:
+            self._drop_embeddings({chunk.get("chunk_id") for chunk in previous})
         self.document_chunks[doc_id] = text_chunks
+        self._index_chunks(doc_id, text_chunks)
+        self._text_index = None
+        self._text_rows = None
+        self._postings_path = None
         
         # Link entities to chunks
         entities_indexed = 0
         for chunk in text_chunks:
-            chunk_id = chunk.get("chunk_id")
+            slot = self._chunk_slot(chunk.get("chunk_id"))
             chunk_entities = chunk.get("entities", [])
             
             for entity in chunk_entities:
-                self.entity_to_chunks[entity].append(chunk_id)
+                self.entity_to_chunks[entity].append(slot)
                 entities_indexed += 1
         
         print(f"   → RAG: Indexed {len(text_chunks)} chunks with {entities_indexed} entity mentions ({len(self.entity_to_chunks)} unique entities)")
+    
+    def _index_chunks(self, doc_id: str, text_chunks: List[Dict[str, Any]]):
+        """Register chunks in the chunk_id -> (doc_id, chunk) lookup"""
+        for chunk in text_chunks:
+            self.chunk_index[chunk.get("chunk_id")] = (doc_id, chunk)
+    
+    def _chunk_slot(self, chunk_id: str) -> int:
+        """Slot number of chunk_id in the chunk id table, assigning one on first sight"""
+        slot = self._chunk_slots.get(chunk_id)
+        if slot is None:
+            slot = self._chunk_slots[chunk_id] = len(self._chunk_ids)
+            self._chunk_ids.append(chunk_id)
+        return slot
+    
+    def _embed_texts(self, texts: List[str]) -> Optional[np.ndarray]:
+        """Normalized float32 embeddings for texts, or None when semantic search is off"""
+        if not (settings.rag_semantic_search and SENTENCE_TRANSFORMERS_AVAILABLE) or not texts:
+            return None
+        vectors = _get_encoder(settings.rag_embedding_model).encode(
+            texts,
+            batch_size=64,
+            normalize_embeddings=True,
+            convert_to_numpy=True
+        )
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+    
+    def _add_embeddings(self, text_chunks: List[Dict[str, Any]]):
+        """Append embeddings for text_chunks to the chunk embedding matrix"""
+        vectors = self._embed_texts([chunk.get("text", "") for chunk in text_chunks])
+        if vectors is None:
+            return
+        self._emb_matrix = vectors if self._emb_matrix is None else np.vstack((self._emb_matrix, vectors))
+        self._emb_chunk_ids.extend(chunk.get("chunk_id") for chunk in text_chunks)
+        self._reset_search_indexes()
+    
+    def _drop_embeddings(self, chunk_ids: set):
+        """Remove the embedding rows of the given chunks"""
+        if self._emb_matrix is None:
+            return
+        keep = np.fromiter((cid not in chunk_ids for cid in self._emb_chunk_ids), dtype=bool, count=len(self._emb_chunk_ids))
+        if keep.all():
+            return
+        self._emb_matrix = self._emb_matrix[keep]
+        self._emb_chunk_ids = [cid for cid, kept in zip(self._emb_chunk_ids, keep) if kept]
+        self._reset_search_indexes()
+    
+    def _reset_search_indexes(self):
+        """Drop the structures derived from _emb_matrix; they are rebuilt on next search"""
+        self._ann_index = None
+        self._emb_bits = None
+        self._binary_index = None
+    
+    def _get_emb_bits(self) -> np.ndarray:
+        if self._emb_bits is None:
+            self._emb_bits = np.packbits(self._emb_matrix > 0, axis=1)
+        return self._emb_bits
+    
+    def _hamming_candidates(self, query_vec: np.ndarray, n_candidates: int) -> np.ndarray:
+        """Rows whose sign-bit codes are nearest the query's in Hamming distance"""
+        query_bits = np.packbits(query_vec > 0, axis=1)
+        bits = self._get_emb_bits()
+        if FAISS_AVAILABLE:
+            if self._binary_index is None:
+                index = faiss.IndexBinaryHNSW(bits.shape[1] * 8, _HNSW_M)
+                index.add(bits)
+                self._binary_index = index
+            _, ids = self._binary_index.search(query_bits, n_candidates)
+            return ids[0][ids[0] >= 0]
+        
+        distances = _POPCOUNT[np.bitwise_xor(bits, query_bits)].sum(axis=1, dtype=np.int32)
+        if n_candidates >= len(distances):
+            return np.arange(len(distances))
+        return np.argpartition(distances, n_candidates - 1)[:n_candidates]
+    
+    def _get_ann_index(self):
+        """HNSW inner-product index over the embedding matrix (row number = id)"""
+        if self._ann_index is None:
+            index = faiss.IndexHNSWFlat(self._emb_matrix.shape[1], _HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.add(self._emb_matrix)
+            self._ann_index = index
+        return self._ann_index
+    
+    def semantic_search(
+        self,
+        query: str,
+        top_k: int = 5,
+        target_doc_id: str = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Find the chunks most similar to query by embedding cosine similarity.
+        Returns (chunk_id, score) pairs, best first.
+        """
+        if self._emb_matrix is None or not len(self._emb_chunk_ids):
+            return []
+        query_vec = self._embed_texts([query])
+        if query_vec is None:
+            return []
+        
+        if target_doc_id:
+            # Exact search over the target document's rows only
+            rows = np.flatnonzero(np.fromiter(
+                (self.chunk_index.get(cid, (None,))[0] == target_doc_id for cid in self._emb_chunk_ids),
+                dtype=bool, count=len(self._emb_chunk_ids)
+            ))
+            scores = self._emb_matrix[rows] @ query_vec[0]
+            order = np.argsort(-scores)[:top_k]
+            return [(self._emb_chunk_ids[rows[i]], float(scores[i])) for i in order]
+        
+        k = min(top_k, len(self._emb_chunk_ids))
+        if settings.rag_binary_quantization:
+            # Shortlist by Hamming distance on sign bits, then rescore with the float vectors
+            rows = self._hamming_candidates(query_vec, k * _BQ_RESCORE_FACTOR)
+            scores = self._emb_matrix[rows] @ query_vec[0]
+            order = np.argsort(-scores)[:k]
+            return [(self._emb_chunk_ids[rows[i]], float(scores[i])) for i in order]
+        
+        if FAISS_AVAILABLE:
+            scores, ids = self._get_ann_index().search(query_vec, k)
+            n_ids = len(self._emb_chunk_ids)
+            return [(self._emb_chunk_ids[i], float(score)) for score, i in zip(scores[0], ids[0]) if 0 <= i < n_ids]
         
-        # TODO: Generate embeddings if LLM service is available
-        # This would use Anthropic embeddings or similar
+        scores = self._emb_matrix @ query_vec[0]
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._emb_chunk_ids[i], float(scores[i])) for i in top]
+    
+    def _chunk_rows(self) -> Tuple[List[Tuple[str, Dict[str, Any]]], Dict[str, Tuple[int, int]]]:
+        """(doc_id, chunk) of every inverted index row, and each document's row range"""
+        if self._text_rows is None:
+            entries = []
+            doc_rows = {}
+            for doc_id, chunks in self.document_chunks.items():
+                start = len(entries)
+                entries.extend((doc_id, chunk) for chunk in chunks)
+                doc_rows[doc_id] = (start, len(entries))
+            self._text_rows = (entries, doc_rows)
+        return self._text_rows
+    
+    def _get_text_index(self, entries: List[Tuple[str, Dict[str, Any]]]) -> Tuple[str, List[int], np.ndarray, np.ndarray]:
+        """The full-text inverted index over entries, loaded from disk or rebuilt from the chunk texts"""
+        if self._text_index is None and self._postings_path is not None and self._postings_path.exists():
+            self._text_index = _load_postings(self._postings_path, len(entries))
+        if self._text_index is None:
+            self._text_index = _build_postings([chunk.get("text", "") for _, chunk in entries])
+        return self._text_index
+    
+    def retrieve_by_query_text(
+        self,
+        query: str,
+        top_k: int = 5,
+        target_doc_id: str = None
+    ) -> List[Tuple[Tuple[str, Dict[str, Any]], int]]:
+        """
+        Full-text search through the inverted index. A chunk scores one point for
+        each whitespace-separated query term that occurs anywhere in its text
+        (case-insensitive substring match); ties keep document order.
+        Returns ((doc_id, chunk), score) pairs, best first.
+        """
+        entries, doc_rows = self._chunk_rows()
+        if not entries:
+            return []
+        postings = self._get_text_index(entries)
+        scores = np.zeros(len(entries), dtype=np.int64)
+        # Repeated query terms count once per occurrence
+        for term, count in Counter(query.lower().split()).items():
+            scores[_term_rows(postings, term)] += count
         
+        offset = 0
+        if target_doc_id:
+            offset, end = doc_rows.get(target_doc_id, (0, 0))
+            scores = scores[offset:end]
+        matched = np.flatnonzero(scores > 0)
+        top = matched[np.argsort(-scores[matched], kind="stable")[:top_k]]
+        return [(entries[offset + i], int(scores[i])) for i in top]
+    
     def set_graph_context(self, graph: nx.Graph, entity_metadata: Dict[str, Dict]):
         """Set the knowledge graph for graph-enhanced retrieval"""
         self.graph = graph
         self.entity_metadata = entity_metadata
+        self._summary_cache.clear()
+        self._nbr_cache = {}
+        self._nbr_cache_key = None
+    
+    def _neighbors(self, entity: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """(neighbor, edge data) pairs of entity, read from the graph once per graph revision"""
+        key = (self.graph.graph.get("revision"), self.graph.number_of_nodes())
+        if key != self._nbr_cache_key:
+            self._nbr_cache = {}
+            self._nbr_cache_key = key
+        neighbors = self._nbr_cache.get(entity)
+        if neighbors is None:
+            neighbors = self._nbr_cache[entity] = list(self.graph.adj[entity].items())
+        return neighbors
         
     def retrieve_context_for_query(
         self, 
@@ -120,19 +539,18 @@ class RAGService:
                 
                 if matched_entity:
                     # Get chunks mentioning this entity
-                    chunk_ids = self.entity_to_chunks.get(matched_entity, [])
-                    print(f"   Found {len(chunk_ids)} chunks for entity '{matched_entity}'")
-                    for chunk_id in chunk_ids:
-                        chunk_scores[chunk_id] += 1.0
+                    slots = self.entity_to_chunks.get(matched_entity, ())
+                    print(f"   Found {len(slots)} chunks for entity '{matched_entity}'")
+                    for slot in slots:
+                        chunk_scores[slot] += 1.0
                     
                     # If graph available, expand to related entities
                     if self.graph and matched_entity in self.graph.nodes():
-                        neighbors = list(self.graph.neighbors(matched_entity))
-                        relevant_entities.update(neighbors[:5])  # Add top 5 neighbors
+                        neighbors = self._neighbors(matched_entity)
+                        relevant_entities.update(neighbor for neighbor, _ in neighbors[:5])  # Add top 5 neighbors
                         
                         # Get relationships
-                        for neighbor in neighbors[:3]:
-                            edge_data = self.graph.get_edge_data(matched_entity, neighbor, {})
+                        for neighbor, edge_data in neighbors[:3]:
                             relevant_relationships.append({
                                 "source": matched_entity,
                                 "target": neighbor,
@@ -144,51 +562,48 @@ class RAGService:
                     print(f"   No match found for entity '{entity}' in indexed entities")
             
             # Get top chunks by score
-            top_chunk_ids = sorted(chunk_scores.items(), key=lambda x: x[1], reverse=True)[:top_k * 2]
-            
-            for chunk_id, score in top_chunk_ids:
-                # Find the chunk in document_chunks
-                for doc_id, chunks in self.document_chunks.items():
-                    # Filter by target document if specified
-                    if target_doc_id and doc_id != target_doc_id:
-                        continue
-                        
-                    for chunk in chunks:
-                        if chunk.get("chunk_id") == chunk_id:
-                            relevant_chunks.append({
-                                **chunk,
-                                "relevance_score": score,
-                                "doc_id": doc_id
-                            })
-                            break
-        
-        # 2. Fallback: If no chunks found through entities, do full-text search
-        if not relevant_chunks:
-            print(f"   ⚠️  No entity-based chunks found, falling back to full-text search")
-            query_lower = query.lower()
-            query_terms = query_lower.split()
+            top_slots = heapq.nlargest(top_k * 2, chunk_scores.items(), key=lambda x: x[1])
             
-            for doc_id, chunks in self.document_chunks.items():
+            for slot, score in top_slots:
+                entry = self.chunk_index.get(self._chunk_ids[slot])
+                if entry is None:
+                    continue
+                doc_id, chunk = entry
                 # Filter by target document if specified
                 if target_doc_id and doc_id != target_doc_id:
                     continue
-                    
-                for chunk in chunks:
-                    text = chunk.get("text", "").lower()
-                    # Score based on term matches
-                    score = sum(1 for term in query_terms if term in text)
-                    if score > 0:
-                        relevant_chunks.append({
-                            **chunk,
-                            "relevance_score": score,
-                            "doc_id": doc_id
-                        })
-            
-            # Sort by relevance
-            relevant_chunks = sorted(relevant_chunks, key=lambda x: x.get("relevance_score", 0), reverse=True)[:top_k]
+                relevant_chunks.append({
+                    **chunk,
+                    "relevance_score": score,
+                    "doc_id": doc_id
+                })
+        
+        # 2. Semantic search: if no chunks found through entities, use chunk embeddings
+        if not relevant_chunks and self._emb_chunk_ids:
+            for chunk_id, score in self.semantic_search(query, top_k, target_doc_id):
+                entry = self.chunk_index.get(chunk_id)
+                if entry is None:
+                    # Embedding row without an indexed chunk (e.g. a partially written index)
+                    continue
+                doc_id, chunk = entry
+                relevant_chunks.append({
+                    **chunk,
+                    "relevance_score": score,
+                    "doc_id": doc_id
+                })
+        
+        # 3. Fallback: If no chunks found through entities or embeddings, do full-text search
+        if not relevant_chunks:
+            print(f"   ⚠️  No entity-based chunks found, falling back to full-text search")
+            for (doc_id, chunk), score in self.retrieve_by_query_text(query, top_k, target_doc_id):
+                relevant_chunks.append({
+                    **chunk,
+                    "relevance_score": score,
+                    "doc_id": doc_id
+                })
             print(f"   ✓ Full-text search found {len(relevant_chunks)} chunks")
         
-        # 3. Graph context summary
+        # 4. Graph context summary
         graph_context = ""
         if include_graph_context and self.graph and entities:
             graph_context = self._build_graph_context_summary(list(relevant_entities))
@@ -206,27 +621,34 @@ class RAGService:
         if not self.graph or not entities:
             return ""
         
-        summary_parts = []
+        # Only the first 5 entities are described. GraphBuilder bumps the graph's
+        # revision on every rebuild, so in-place rebuilds don't serve stale summaries.
+        key = (self.graph.graph.get("revision"), self.graph.number_of_nodes(), tuple(entities[:5]))
+        summary = self._summary_cache.get(key)
+        if summary is not None:
+            self._summary_cache.move_to_end(key)
+            return summary
         
-        # Get subgraph of relevant entities
-        relevant_nodes = set()
-        for entity in entities:
-            if entity in self.graph.nodes():
-                relevant_nodes.add(entity)
-                # Add immediate neighbors
-                relevant_nodes.update(list(self.graph.neighbors(entity))[:3])
+        summary = self._describe_connections(entities[:5])
+        self._summary_cache[key] = summary
+        if len(self._summary_cache) > _SUMMARY_CACHE_SIZE:
+            self._summary_cache.popitem(last=False)
+        return summary
+    
+    def _describe_connections(self, entities: List[str]) -> str:
+        """Describe the first few connections of each entity, one line per entity"""
+        summary_parts = []
         
         # Describe key relationships
-        for entity in entities[:5]:  # Limit to top 5 entities
+        for entity in entities:
             if entity not in self.graph.nodes():
                 continue
                 
-            neighbors = list(self.graph.neighbors(entity))
+            neighbors = self._neighbors(entity)
             if neighbors:
                 # Get strongest connections
                 connections = []
-                for neighbor in neighbors[:3]:
-                    edge_data = self.graph.get_edge_data(entity, neighbor, {})
+                for neighbor, edge_data in neighbors[:3]:
                     weight = edge_data.get("weight", 1.0)
                     rel_type = edge_data.get("relationship_type", "related to")
                     connections.append(f"{neighbor} ({rel_type}, strength: {weight:.2f})")
@@ -338,20 +760,18 @@ CONTEXT:
         }
         
         # Get chunks mentioning this entity
-        chunk_ids = self.entity_to_chunks.get(entity, [])
-        for chunk_id in chunk_ids:
-            for doc_id, chunks in self.document_chunks.items():
-                for chunk in chunks:
-                    if chunk.get("chunk_id") == chunk_id:
-                        context["chunks"].append({**chunk, "doc_id": doc_id})
+        for slot in self.entity_to_chunks.get(entity, ()):
+            entry = self.chunk_index.get(self._chunk_ids[slot])
+            if entry is not None:
+                doc_id, chunk = entry
+                context["chunks"].append({**chunk, "doc_id": doc_id})
         
         # Get graph neighborhood
         if self.graph and entity in self.graph.nodes():
-            neighbors = list(self.graph.neighbors(entity))
-            context["neighbors"] = neighbors
+            neighbors = self._neighbors(entity)
+            context["neighbors"] = [neighbor for neighbor, _ in neighbors]
             
-            for neighbor in neighbors:
-                edge_data = self.graph.get_edge_data(entity, neighbor, {})
+            for neighbor, edge_data in neighbors:
                 context["relationships"].append({
                     "target": neighbor,
                     "type": edge_data.get("relationship_type", "RELATED"),
@@ -362,29 +782,85 @@ CONTEXT:
         return context
     
     def save_index(self, filepath: str):
-        """Save the RAG index to disk"""
-        index_data = {
+        """
+        Save the RAG index to disk: metadata as JSON at filepath, and next to it the
+        full-text postings (.tokens.npz), the embedding matrix (.npy) and the ANN
+        index if built (.faiss)
+        """
+        path = Path(filepath)
+        write_index_metadata(filepath, {
             "document_chunks": self.document_chunks,
-            "chunk_embeddings": self.chunk_embeddings,
-            "entity_to_chunks": dict(self.entity_to_chunks),
+            "embedding_chunk_ids": self._emb_chunk_ids,
+            "entity_to_chunks": {entity: slots.tolist() for entity, slots in self.entity_to_chunks.items()},
+            "chunk_ids": self._chunk_ids,
             "entity_metadata": self.entity_metadata
-        }
+        })
         
-        with open(filepath, 'wb') as f:
-            pickle.dump(index_data, f)
+        entries, _ = self._chunk_rows()
+        postings_path = path.with_suffix(".tokens.npz")
+        _write_atomic(postings_path, lambda tmp: _save_postings(tmp, self._get_text_index(entries), len(entries)))
+        self._postings_path = postings_path
+        
+        emb_path = path.with_suffix(".npy")
+        faiss_path = path.with_suffix(".faiss")
+        if self._emb_matrix is not None:
+            _write_atomic(emb_path, lambda tmp: _save_npy(tmp, self._emb_matrix))
+        else:
+            emb_path.unlink(missing_ok=True)
+        if self._ann_index is not None:
+            _write_atomic(faiss_path, lambda tmp: faiss.write_index(self._ann_index, tmp))
+        else:
+            faiss_path.unlink(missing_ok=True)
     
     def load_index(self, filepath: str):
-        """Load the RAG index from disk"""
-        if not Path(filepath).exists():
-            return False
-        
-        with open(filepath, 'rb') as f:
-            index_data = pickle.load(f)
+        """Load the RAG index from disk (embeddings are memory-mapped, not read up front)"""
+        path = Path(filepath)
+        if path.exists():
+            index_data = read_index_metadata(filepath)
+            emb_path = path.with_suffix(".npy")
+            emb_matrix = np.load(emb_path, mmap_mode="r") if emb_path.exists() else None
+        else:
+            index_data = _read_legacy_index(path)
+            if index_data is None:
+                return False
+            emb_matrix = index_data.get("embedding_matrix")
         
         self.document_chunks = index_data.get("document_chunks", {})
-        self.chunk_embeddings = index_data.get("chunk_embeddings", {})
-        self.entity_to_chunks = defaultdict(list, index_data.get("entity_to_chunks", {}))
+        self._emb_chunk_ids = index_data.get("embedding_chunk_ids", [])
+        self._emb_matrix = emb_matrix
+        self._reset_search_indexes()
+        if emb_matrix is None or len(emb_matrix) != len(self._emb_chunk_ids):
+            self._emb_matrix = None
+            self._emb_chunk_ids = []
+        elif FAISS_AVAILABLE and path.with_suffix(".faiss").exists():
+            ann_index = faiss.read_index(str(path.with_suffix(".faiss")))
+            if ann_index.ntotal == len(self._emb_chunk_ids):
+                self._ann_index = ann_index
+        self._load_entity_links(index_data.get("entity_to_chunks", {}), index_data.get("chunk_ids"))
         self.entity_metadata = index_data.get("entity_metadata", {})
         
+        # The full-text index is only read from disk if a query falls back to it
+        self._text_index = None
+        self._text_rows = None
+        self._postings_path = path.with_suffix(".tokens.npz") if path.exists() else None
+        
+        # The chunk lookup is derived data, rebuilt rather than persisted
+        self.chunk_index = {}
+        for doc_id, chunks in self.document_chunks.items():
+            self._index_chunks(doc_id, chunks)
+        
         return True
-
+    
+    def _load_entity_links(self, entity_to_chunks: Dict[str, Any], chunk_ids: Optional[List[str]]):
+        """Restore entity -> chunk slot arrays (older indexes stored chunk_id lists)"""
+        self.entity_to_chunks = defaultdict(_new_slot_array)
+        if chunk_ids is not None:
+            self._chunk_ids = list(chunk_ids)
+            self._chunk_slots = {chunk_id: slot for slot, chunk_id in enumerate(self._chunk_ids)}
+            for entity, slots in entity_to_chunks.items():
+                self.entity_to_chunks[entity] = array("i", slots)
+            return
+        self._chunk_ids = []
+        self._chunk_slots = {}
+        for entity, ids in entity_to_chunks.items():
+            self.entity_to_chunks[entity] = array("i", map(self._chunk_slot, ids))
@@ -1,13 +1,40 @@
-from typing import List, Dict, Tuple, Set
-from collections import defaultdict
-from itertools import combinations
+from typing import List, Dict
 import re
+import numpy as np
+from app.config import settings
+
+# Optional multi-pattern scanner used to find which relationship patterns a sentence can match
+try:
+    import hyperscan
+    HYPERSCAN_AVAILABLE = True
+except ImportError:
+    HYPERSCAN_AVAILABLE = False
+
+# The characters Python's re treats as \s, spelled out for the Hyperscan prefilter
+_PY_WHITESPACE_CLASS = (
+    r"[\t\n\x0b\x0c\r\x1c-\x20\x{85}\x{a0}\x{1680}\x{2000}-\x{200a}"
+    r"\x{2028}\x{2029}\x{202f}\x{205f}\x{3000}]"
+)
+
+# Evidence sentences kept per merged relationship
+_MAX_EVIDENCE = 3
+
+
+def _add_evidence(evidence: List[str], sentences: List[str]) -> List[str]:
+    """Append sentences not already in evidence, stopping once it holds _MAX_EVIDENCE"""
+    for sentence in sentences:
+        if len(evidence) >= _MAX_EVIDENCE:
+            break
+        if sentence not in evidence:
+            evidence.append(sentence)
+    return evidence
 
 
 class RelationshipExtractor:
     """Extract relationships between entities based on co-occurrence and patterns"""
     
-    def __init__(self):
+    def __init__(self, llm_service=None):
+        self.llm_service = llm_service
         self.min_relationship_strength = 1  # Minimum co-occurrences to keep
         
         # Relationship patterns for semantic extraction
@@ -29,48 +56,144 @@ class RelationshipExtractor:
             # Expression/Regulation
             (r"(\w+)\s+(expresses?|activates?|upregulates?|downregulates?)\s+(\w+)", "REGULATES"),
         ]
+        self._compiled_patterns = [
+            (re.compile(pattern, re.IGNORECASE), rel_type)
+            for pattern, rel_type in self.relationship_patterns
+        ]
+        # Every pattern has the form "(\w+)\s+(<verb phrases>)\s+(\w+)", so a sentence can
+        # only match if one of the verb phrases appears between whitespace. Checking that
+        # is far cheaper than running the patterns, and most sentences fail it.
+        head, tail = r"(\w+)\s+(", r")\s+(\w+)"
+        verb_phrases = [
+            pattern[len(head):-len(tail)] for pattern, _ in self.relationship_patterns
+            if pattern.startswith(head) and pattern.endswith(tail)
+        ]
+        complete = len(verb_phrases) == len(self.relationship_patterns)
+        self._verb_prefilter = (
+            re.compile(r"\s(?:" + "|".join(verb_phrases) + r")\s", re.IGNORECASE)
+            if complete else None
+        )
+        # With Hyperscan, one scan over all sentences also tells which patterns each can match
+        self._hs_db = None
+        if complete and HYPERSCAN_AVAILABLE:
+            try:
+                db = hyperscan.Database()
+                db.compile(
+                    expressions=[
+                        f"{_PY_WHITESPACE_CLASS}(?:{phrase}){_PY_WHITESPACE_CLASS}".encode()
+                        for phrase in verb_phrases
+                    ],
+                    ids=list(range(len(verb_phrases))),
+                    flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_UTF8] * len(verb_phrases),
+                )
+                self._hs_db = db
+            except Exception as e:
+                print(f"Hyperscan pattern compile failed, using re prefilter: {e}")
+    
+    def _candidate_patterns(self, sentences: List[str]) -> List[List[int]]:
+        """For each sentence, indices of the relationship patterns that could match it"""
+        all_patterns = list(range(len(self._compiled_patterns)))
+        if self._hs_db is not None:
+            try:
+                return self._hyperscan_candidates(sentences)
+            except Exception as e:
+                print(f"Hyperscan scan failed, using re prefilter: {e}")
+        if self._verb_prefilter is None:
+            return [all_patterns] * len(sentences)
+        search = self._verb_prefilter.search
+        return [all_patterns if search(sentence) else [] for sentence in sentences]
+    
+    def _hyperscan_candidates(self, sentences: List[str]) -> List[List[int]]:
+        """Scan all sentences in one Hyperscan pass, newline-separated, and bucket hits by sentence"""
+        encoded = [sentence.encode("utf-8") for sentence in sentences]
+        # Byte offset at which each sentence's separator starts
+        ends = np.cumsum([len(part) + 1 for part in encoded]) - 1
+        hits = []
+        
+        def on_match(pattern_id, start, end, flags, context):
+            hits.append((end, pattern_id))
+        
+        self._hs_db.scan(b"\n".join(encoded), match_event_handler=on_match)
+        
+        candidates = [set() for _ in sentences]
+        if hits:
+            # A match may end on the separator after its sentence, hence end - 1
+            match_ends = np.fromiter((end for end, _ in hits), dtype=np.int64, count=len(hits))
+            owners = np.searchsorted(ends, match_ends - 1)
+            for owner, (_, pattern_id) in zip(owners.tolist(), hits):
+                if owner < len(sentences):
+                    candidates[owner].add(pattern_id)
+        return [sorted(ids) for ids in candidates]
     
     def extract_cooccurrence_relationships(
         self, 
         sentence_entities: List[Dict[str, any]]
     ) -> List[Dict[str, any]]:
         """Extract relationships based on entity co-occurrence in sentences"""
-        relationships = defaultdict(lambda: {"weight": 0, "evidence": []})
+        # Entity ids follow sorted name order, so comparing ids compares names
+        texts = [ent["text"] for sent_data in sentence_entities for ent in sent_data["entities"]]
+        names = sorted(set(texts))
+        if not names:
+            return []
+        name_ids = {name: idx for idx, name in enumerate(names)}
+        lower_ids = {}
+        name_lower = np.array([lower_ids.setdefault(name.lower(), len(lower_ids)) for name in names], dtype=np.int64)
+        entity_ids = np.fromiter((name_ids[text] for text in texts), dtype=np.int64, count=len(texts))
         
-        for sent_data in sentence_entities:
-            entities = sent_data["entities"]
-            sentence = sent_data["sentence"]
-            
-            # Create pairs of entities in the same sentence
-            if len(entities) >= 2:
-                for i, ent1 in enumerate(entities):
-                    for ent2 in entities[i+1:]:
-                        # Create canonical edge (alphabetically sorted to avoid duplicates)
-                        entity1 = ent1["text"]
-                        entity2 = ent2["text"]
-                        
-                        # Skip if same entity
-                        if entity1.lower() == entity2.lower():
-                            continue
-                        
-                        edge_key = tuple(sorted([entity1, entity2]))
-                        relationships[edge_key]["weight"] += 1
-                        
-                        # Only store a few evidence sentences per relationship
-                        if len(relationships[edge_key]["evidence"]) < 3:
-                            relationships[edge_key]["evidence"].append(sentence)
+        # Every (i, j), i < j, entity pair of every sentence, in the order of the nested loops
+        counts = np.fromiter((len(sent_data["entities"]) for sent_data in sentence_entities), dtype=np.int64, count=len(sentence_entities))
+        starts = np.cumsum(counts) - counts
+        n_pairs = counts * (counts - 1) // 2
+        pair_starts = np.cumsum(n_pairs) - n_pairs
+        left = np.empty(int(n_pairs.sum()), dtype=np.int64)
+        right = np.empty_like(left)
+        for k in np.unique(counts[counts >= 2]).tolist():
+            sents = np.flatnonzero(counts == k)
+            first, second = np.triu_indices(k, 1)
+            slots = pair_starts[sents, None] + np.arange(len(first))
+            left[slots] = starts[sents, None] + first
+            right[slots] = starts[sents, None] + second
+        pair_sentence = np.repeat(np.arange(len(sentence_entities)), n_pairs)
+        
+        # Skip same-entity pairs (case-insensitive) and canonicalize the edge
+        a = entity_ids[left]
+        b = entity_ids[right]
+        keep = name_lower[a] != name_lower[b]
+        a, b, pair_sentence = a[keep], b[keep], pair_sentence[keep]
+        edge_keys = np.minimum(a, b) * len(names) + np.maximum(a, b)
+        
+        edges, first_seen, inverse, weights = np.unique(
+            edge_keys, return_index=True, return_inverse=True, return_counts=True
+        )
+        # Pairs grouped by edge, each group in encounter order; the first 3 give the evidence
+        by_edge = np.argsort(inverse, kind="stable")
+        group_starts = np.cumsum(weights) - weights
+        
+        # Edges in order of first co-occurrence, and the positions of their evidence pairs
+        order = np.argsort(first_seen, kind="stable")
+        order = order[weights[order] >= self.min_relationship_strength]
+        n_evidence = np.minimum(weights[order], 3)
+        evidence_starts = np.cumsum(n_evidence) - n_evidence
+        evidence_pairs = by_edge[
+            np.repeat(group_starts[order] - evidence_starts, n_evidence) + np.arange(int(n_evidence.sum()))
+        ]
+        evidence = [sentence_entities[sid]["sentence"] for sid in pair_sentence[evidence_pairs].tolist()]
+        sources, targets = np.divmod(edges[order], len(names))
         
         # Convert to list format
         result = []
-        for (entity1, entity2), data in relationships.items():
-            if data["weight"] >= self.min_relationship_strength:
-                result.append({
-                    "source": entity1,
-                    "target": entity2,
-                    "weight": data["weight"],
-                    "evidence": data["evidence"],
-                    "relationship_type": "CO_OCCURRENCE"
-                })
+        pos = 0
+        for source, target, weight, n_ev in zip(
+            sources.tolist(), targets.tolist(), weights[order].tolist(), n_evidence.tolist()
+        ):
+            result.append({
+                "source": names[source],
+                "target": names[target],
+                "weight": weight,
+                "evidence": evidence[pos:pos + n_ev],
+                "relationship_type": "CO_OCCURRENCE"
+            })
+            pos += n_ev
         
         return result
     
@@ -81,13 +204,18 @@ class RelationshipExtractor:
         """Extract relationships based on linguistic patterns"""
         relationships = []
         
-        for sent_data in sentence_entities:
+        candidates = self._candidate_patterns([sent_data["sentence"] for sent_data in sentence_entities])
+        
+        for sent_data, pattern_ids in zip(sentence_entities, candidates):
+            if not pattern_ids:
+                continue
             sentence = sent_data["sentence"]
             entities = {ent["text"]: ent for ent in sent_data["entities"]}
             
-            # Try each pattern
-            for pattern, rel_type in self.relationship_patterns:
-                matches = re.finditer(pattern, sentence, re.IGNORECASE)
+            # Try each pattern that can match
+            for pattern_idx in pattern_ids:
+                pattern, rel_type = self._compiled_patterns[pattern_idx]
+                matches = pattern.finditer(sentence)
                 
                 for match in matches:
                     # Check if matched terms are entities
@@ -115,32 +243,33 @@ class RelationshipExtractor:
         
         # Add co-occurrence relationships
         for rel in cooccurrence_rels:
-            edge_key = tuple(sorted([rel["source"], rel["target"]]))
+            source, target = rel["source"], rel["target"]
+            edge_key = (source, target) if source <= target else (target, source)
             if edge_key not in merged:
+                rel["evidence"] = _add_evidence([], rel["evidence"])
                 merged[edge_key] = rel
         
         # Merge pattern relationships
         for rel in pattern_rels:
-            edge_key = tuple(sorted([rel["source"], rel["target"]]))
+            source, target = rel["source"], rel["target"]
+            edge_key = (source, target) if source <= target else (target, source)
             if edge_key in merged:
                 # Update existing relationship
                 merged[edge_key]["weight"] += rel["weight"]
-                merged[edge_key]["evidence"].extend(rel["evidence"])
+                _add_evidence(merged[edge_key]["evidence"], rel["evidence"])
                 merged[edge_key]["relationship_type"] = rel["relationship_type"]  # Prefer semantic type
             else:
+                rel["evidence"] = _add_evidence([], rel["evidence"])
                 merged[edge_key] = rel
         
-        # Convert back to list and limit evidence
+        # Convert back to list (evidence is already unique and capped)
         result = []
         for (entity1, entity2), data in merged.items():
-            # Keep only unique evidence sentences (up to 3)
-            unique_evidence = list(dict.fromkeys(data["evidence"]))[:3]
-            
             result.append({
                 "source": entity1,
                 "target": entity2,
                 "weight": data["weight"],
-                "evidence": unique_evidence,
+                "evidence": data["evidence"],
                 "relationship_type": data.get("relationship_type", "CO_OCCURRENCE")
             })
         
@@ -155,4 +284,65 @@ class RelationshipExtractor:
         pattern_rels = self.extract_pattern_relationships(sentence_entities)
         
         return self.merge_relationships(cooccurrence_rels, pattern_rels)
-
+    
+    async def extract_llm_relationships(
+        self,
+        sentence_entities: List[Dict[str, any]]
+    ) -> List[Dict[str, any]]:
+        """
+        Extract semantic relationships with the LLM, several sentences per request
+        by default; llm_extraction_mode selects one request per sentence
+        ("per_sentence") or the Message Batches API ("batch") instead
+        """
+        candidates = [
+            sent_data for sent_data in sentence_entities
+            if len(sent_data["entities"]) >= 2
+        ]
+        if not candidates:
+            return []
+        
+        sentences_entities = [
+            (sent_data["sentence"], list(dict.fromkeys(ent["text"] for ent in sent_data["entities"])))
+            for sent_data in candidates
+        ]
+        if settings.llm_extraction_mode == "batch":
+            per_sentence = await self.llm_service.extract_relationships_batch(sentences_entities)
+        elif settings.llm_extraction_mode == "per_sentence":
+            per_sentence = await self.llm_service.extract_relationships_many(
+                sentences_entities, max_concurrency=settings.llm_max_concurrency
+            )
+        else:
+            per_sentence = await self.llm_service.extract_relationships_bulk(sentences_entities)
+        
+        relationships = []
+        for sent_data, llm_rels in zip(candidates, per_sentence):
+            names = {ent["text"] for ent in sent_data["entities"]}
+            for rel in llm_rels:
+                if not isinstance(rel, dict):
+                    continue
+                source = rel.get("source")
+                target = rel.get("target")
+                # Keep only relationships between entities NER found in this sentence
+                if source not in names or target not in names or source == target:
+                    continue
+                relationships.append({
+                    "source": source,
+                    "target": target,
+                    "weight": 2.0,  # Same weight as pattern-based relationships
+                    "evidence": [sent_data["sentence"]],
+                    "relationship_type": str(rel.get("type") or "ASSOCIATES_WITH").upper()
+                })
+        
+        return relationships
+    
+    async def extract_all_relationships_with_llm(
+        self,
+        sentence_entities: List[Dict[str, any]]
+    ) -> List[Dict[str, any]]:
+        """Extract all relationships, adding LLM-extracted ones when LLM extraction is enabled"""
+        relationships = self.extract_all_relationships(sentence_entities)
+        if not (settings.enable_llm_extraction and self.llm_service and self.llm_service.enabled):
+            return relationships
+        
+        llm_rels = await self.extract_llm_relationships(sentence_entities)
+        return self.merge_relationships(relationships, llm_rels)